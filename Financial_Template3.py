@@ -4,6 +4,13 @@ import plotly.graph_objects as go
 import json
 import os
 
+import numpy as np
+
+from cpf_engine import (SENSITIVITY_FIELDS, IncrementalProjection, align_financial_data, goal_seek,
+                        net_worth_sensitivities, sweep_final_net_worth)
+from cpf_cache import PROJECTION_CACHE, projection_key
+from cpf_simulation import RETURN_DISTRIBUTIONS, simulate_cpf_balance_streaming
+
 # Function to save a profile
 def save_profile(profile_name, data):
     if not os.path.exists("profiles"):
@@ -27,205 +34,44 @@ def delete_profile(profile_name):
     if os.path.exists(f"profiles/{profile_name}.json"):
         os.remove(f"profiles/{profile_name}.json")
 
-# CPF allocation rates based on age
-def get_cpf_allocation_rates(age):
-    if age < 35:
-        return 0.6227, 0.1621, 0.2152
-    elif age < 45:
-        return 0.5859, 0.1933, 0.2208
-    elif age < 55:
-        return 0.5117, 0.2421, 0.2462
-    elif age < 65:
-        return 0.2123, 0.3929, 0.3948
-    else:
-        return 0.085, 0.405, 0.51
-
-# CPF contribution rates based on age
-def get_cpf_rates(age):
-    if age < 55:
-        return 0.17, 0.20, 0.37
-    elif age < 65:
-        return 0.13, 0.13, 0.26
-    else:
-        return 0.075, 0.05, 0.125
-
-# Add a new function to calculate CPF balance without investment
-def calculate_cpf_balance_without_investment(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
-                                              milestones, existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0):
-    cpf_balance = {
-        'Year': [],
-        'Age': [],
-        'Cumulative Cash Savings': [],
-        'Cumulative OA': [],
-        'Cumulative SA': [],
-        'Cumulative MA': [],
-        'Cumulative Total CPF': [],
-        'Net Worth': []
-    }
-    years_worked = projected_age - current_age + 1
-    cumulative_cash_savings = existing_cash
-    cumulative_oa = existing_oa
-    cumulative_sa = existing_sa
-    cumulative_ma = existing_ma
-    cumulative_total_cpf = existing_oa + existing_sa + existing_ma
-    net_worth = existing_cash + existing_oa + existing_sa + existing_ma
-
-    for year in range(years_worked):
-        age = current_age + year
-        oa_rate, sa_rate, ma_rate = get_cpf_allocation_rates(age)
-        employer_rate, employee_rate, total_rate = get_cpf_rates(age)
-        annual_income = salary * 12 + bonus + thirteenth_month
-        cpf_contribution = annual_income * total_rate
-        net_monthly_salary = (salary * (1 - employee_rate)) - monthly_expenses
-        net_annual_salary = (net_monthly_salary * 12) + (bonus * (1 - employee_rate)) + (
-            thirteenth_month * (1 - employee_rate))
-        cumulative_cash_savings += net_annual_salary
-        cumulative_oa += cpf_contribution * oa_rate
-        cumulative_sa += cpf_contribution * sa_rate
-        cumulative_ma += cpf_contribution * ma_rate
-        cumulative_total_cpf = cumulative_oa + cumulative_sa + cumulative_ma
-        net_worth = cumulative_cash_savings + cumulative_oa + cumulative_sa + cumulative_ma
-
-        # Apply financial milestones
-        if age in milestones:
-            net_worth += milestones[age]
-            cumulative_cash_savings += milestones[age]
-
-        cpf_balance['Year'].append(year + 1)
-        cpf_balance['Age'].append(age)
-        cpf_balance['Cumulative Cash Savings'].append(round(cumulative_cash_savings, 2))
-        cpf_balance['Cumulative OA'].append(round(cumulative_oa, 2))
-        cpf_balance['Cumulative SA'].append(round(cumulative_sa, 2))
-        cpf_balance['Cumulative MA'].append(round(cumulative_ma, 2))
-        cpf_balance['Cumulative Total CPF'].append(round(cumulative_total_cpf, 2))
-        cpf_balance['Net Worth'].append(round(net_worth, 2))
-
-    return cpf_balance
-
-# Calculate CPF balance and financial metrics
-def calculate_cpf_balance(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
-                          annual_investment_premium, annual_interest_rate, milestones,
-                          existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
-                          investment_current_age=0):
-    cpf_balance = {
-        'Year': [],
-        'Age': [],
-        'Cumulative Cash Savings': [],
-        'Cumulative OA': [],
-        'Cumulative SA': [],
-        'Cumulative MA': [],
-        'Cumulative Total CPF': [],
-        'Cumulative Investment Premium': [],
-        'Investment Value': [],
-        'Net Worth': []
-    }
-    years_worked = projected_age - current_age + 1
-    cumulative_cash_savings = existing_cash
-    cumulative_oa = existing_oa
-    cumulative_sa = existing_sa
-    cumulative_ma = existing_ma
-    cumulative_total_cpf = existing_oa + existing_sa + existing_ma
-    cumulative_investment_premium = 0.0
-    investment_value = 0.0
-    net_worth = existing_cash + existing_oa + existing_sa + existing_ma
-    milestone_percentage = 1.0  # Adjust this percentage if needed
-
-    for year in range(years_worked):
-        age = current_age + year
-        oa_rate, sa_rate, ma_rate = get_cpf_allocation_rates(age)
-        employer_rate, employee_rate, total_rate = get_cpf_rates(age)
-        annual_income = salary * 12 + bonus + thirteenth_month
-        cpf_contribution = annual_income * total_rate
-        net_monthly_salary = (salary * (1 - employee_rate)) - monthly_expenses
-        net_annual_salary = (net_monthly_salary * 12) + (bonus * (1 - employee_rate)) + (
-            thirteenth_month * (1 - employee_rate))
-        cumulative_cash_savings += net_annual_salary
-        # Apply annual investment premium only after the investment start age
-        if age >= investment_current_age:
-            cumulative_cash_savings -= annual_investment_premium
-            cumulative_investment_premium += annual_investment_premium
-            investment_value = (investment_value + annual_investment_premium) * (1 + annual_interest_rate / 100)
-        cumulative_oa += cpf_contribution * oa_rate
-        cumulative_sa += cpf_contribution * sa_rate
-        cumulative_ma += cpf_contribution * ma_rate
-        cumulative_total_cpf = cumulative_oa + cumulative_sa + cumulative_ma
-        net_worth = cumulative_cash_savings + cumulative_oa + cumulative_sa + cumulative_ma + investment_value
-        # Apply financial milestones
-        if age in milestones:
-            net_worth += milestones[age] * milestone_percentage
-            cumulative_cash_savings += milestones[age] * milestone_percentage  # Ensure the effect is permanent
-        cpf_balance['Year'].append(year + 1)
-        cpf_balance['Age'].append(age)
-        cpf_balance['Cumulative Cash Savings'].append(round(cumulative_cash_savings, 2))
-        cpf_balance['Cumulative OA'].append(round(cumulative_oa, 2))
-        cpf_balance['Cumulative SA'].append(round(cumulative_sa, 2))
-        cpf_balance['Cumulative MA'].append(round(cumulative_ma, 2))
-        cpf_balance['Cumulative Total CPF'].append(round(cumulative_total_cpf, 2))
-        cpf_balance['Cumulative Investment Premium'].append(round(cumulative_investment_premium, 2))
-        cpf_balance['Investment Value'].append(round(investment_value, 2))
-        cpf_balance['Net Worth'].append(round(net_worth, 2))
-    return cpf_balance
-
-# Align financial data for combined analysis
-def align_financial_data(df1, df2, start_year_1, start_year_2):
-    min_year = min(start_year_1, start_year_2)
-    max_year = max(df1['Year'].iloc[-1], df2['Year'].iloc[-1])
-    combined_data = {
-        'Year': list(range(min_year, max_year + 1)),
-        'Cumulative Cash Savings': [],
-        'Cumulative OA': [],
-        'Cumulative SA': [],
-        'Cumulative MA': [],
-        'Cumulative Total CPF': [],
-        'Cumulative Investment Premium': [],
-        'Investment Value': [],
-        'Net Worth': []
-    }
-    cumulative_cash_savings_1 = cumulative_cash_savings_2 = 0
-    cumulative_oa_1 = cumulative_oa_2 = 0
-    cumulative_sa_1 = cumulative_sa_2 = 0
-    cumulative_ma_1 = cumulative_ma_2 = 0
-    cumulative_total_cpf_1 = cumulative_total_cpf_2 = 0
-    cumulative_investment_premium_1 = cumulative_investment_premium_2 = 0
-    investment_value_1 = investment_value_2 = 0
-    net_worth_1 = net_worth_2 = 0
-    for year in combined_data['Year']:
-        if year in df1['Year'].values:
-            idx = df1['Year'].values.tolist().index(year)
-            cumulative_cash_savings_1 = df1['Cumulative Cash Savings'].iloc[idx]
-            cumulative_oa_1 = df1['Cumulative OA'].iloc[idx]
-            cumulative_sa_1 = df1['Cumulative SA'].iloc[idx]
-            cumulative_ma_1 = df1['Cumulative MA'].iloc[idx]
-            cumulative_total_cpf_1 = df1['Cumulative Total CPF'].iloc[idx]
-            # Check if 'Cumulative Investment Premium' exists in df1
-            cumulative_investment_premium_1 = df1['Cumulative Investment Premium'].iloc[idx] if 'Cumulative Investment Premium' in df1.columns else 0
-            investment_value_1 = df1['Investment Value'].iloc[idx] if 'Investment Value' in df1.columns else 0
-            net_worth_1 = df1['Net Worth'].iloc[idx]
-        if year in df2['Year'].values:
-            idx = df2['Year'].values.tolist().index(year)
-            cumulative_cash_savings_2 = df2['Cumulative Cash Savings'].iloc[idx]
-            cumulative_oa_2 = df2['Cumulative OA'].iloc[idx]
-            cumulative_sa_2 = df2['Cumulative SA'].iloc[idx]
-            cumulative_ma_2 = df2['Cumulative MA'].iloc[idx]
-            cumulative_total_cpf_2 = df2['Cumulative Total CPF'].iloc[idx]
-            # Check if 'Cumulative Investment Premium' exists in df2
-            cumulative_investment_premium_2 = df2['Cumulative Investment Premium'].iloc[idx] if 'Cumulative Investment Premium' in df2.columns else 0
-            investment_value_2 = df2['Investment Value'].iloc[idx] if 'Investment Value' in df2.columns else 0
-            net_worth_2 = df2['Net Worth'].iloc[idx]
-        combined_data['Cumulative Cash Savings'].append(cumulative_cash_savings_1 + cumulative_cash_savings_2)
-        combined_data['Cumulative OA'].append(cumulative_oa_1 + cumulative_oa_2)
-        combined_data['Cumulative SA'].append(cumulative_sa_1 + cumulative_sa_2)
-        combined_data['Cumulative MA'].append(cumulative_ma_1 + cumulative_ma_2)
-        combined_data['Cumulative Total CPF'].append(cumulative_total_cpf_1 + cumulative_total_cpf_2)
-        combined_data['Cumulative Investment Premium'].append(cumulative_investment_premium_1 + cumulative_investment_premium_2)
-        combined_data['Investment Value'].append(investment_value_1 + investment_value_2)
-        combined_data['Net Worth'].append(net_worth_1 + net_worth_2)
-    return pd.DataFrame(combined_data)
+# Columns of the recurring milestone table
+RECURRING_MILESTONE_COLUMNS = ["Start Age", "End Age", "Every (years)", "Amount", "Escalation (%)"]
+
+# Lowest yearly escalation the recurring milestone table accepts; at -100% an amount would vanish
+MIN_MILESTONE_ESCALATION = -99.0
+
+# Table of recurring milestones (loans, tuition, insurance), one row per plan, returned as timeline events.
+# A blank end age repeats until the projected age, a blank interval means every year.
+def recurring_milestone_editor(key):
+    table = st.data_editor(
+        pd.DataFrame({column: pd.Series(dtype=float) for column in RECURRING_MILESTONE_COLUMNS}),
+        num_rows="dynamic", use_container_width=True, key=key,
+        column_config={
+            "Start Age": st.column_config.NumberColumn(min_value=0, step=1),
+            "End Age": st.column_config.NumberColumn(min_value=0, step=1),
+            "Every (years)": st.column_config.NumberColumn(min_value=1, step=1),
+            "Escalation (%)": st.column_config.NumberColumn(min_value=MIN_MILESTONE_ESCALATION)
+        })
+    events = []
+    for start_age, end_age, every, amount, escalation in table.dropna(
+            subset=["Start Age", "Amount"]).itertuples(index=False):
+        events.append({
+            "start_age": int(start_age),
+            "end_age": None if pd.isna(end_age) else int(end_age),
+            "every": 1 if pd.isna(every) else max(int(every), 1),
+            "amount": float(amount),
+            "escalation": 0.0 if pd.isna(escalation) else max(float(escalation), MIN_MILESTONE_ESCALATION)
+        })
+    return events
 
 # Streamlit App
 st.header("Financial Analysis")
 st.subheader("Key in your information here")
 
+# Per-person projections kept across reruns so an edit only recomputes the years it affects
+if "projections" not in st.session_state:
+    st.session_state.projections = {"person_1": IncrementalProjection(), "person_2": IncrementalProjection()}
+
 # Initialize session state for profile data
 if "profile_data" not in st.session_state:
     st.session_state.profile_data = {
@@ -371,13 +217,16 @@ if analysis_type == 'Single':
 
     st.subheader("Financial Milestones")
     num_milestones = st.number_input("Enter the number of financial milestones:", min_value=0, step=1)
-    milestones = {}
+    # Milestones as a list of events, so two milestones at the same age add up instead of overwriting
+    milestones = []
     for i in range(num_milestones):
         age = st.number_input(f"Enter the age for milestone {i + 1}:", min_value=0, step=1, key=f"age_{i}")
         amount = st.number_input(
             f"Enter the amount for milestone {i + 1} (negative for expenses, positive for gains):",
             step=100.0, key=f"amount_{i}")
-        milestones[age] = amount
+        milestones.append({"age": age, "amount": amount})
+    st.write("Recurring milestones (negative for expenses, positive for gains), growing by the escalation rate each year:")
+    milestones.extend(recurring_milestone_editor("recurring_milestones"))
 
     # Update session state with current inputs
     st.session_state.profile_data["person_1"] = {
@@ -398,22 +247,33 @@ if analysis_type == 'Single':
         "existing_cash": existing_cash
     }
 
-    if st.button("Calculate"):
-        cpf_balance = calculate_cpf_balance(salary, bonus, thirteenth_month, monthly_expenses, current_age,
-                                            projected_age, annual_investment_premium, annual_interest_rate, milestones,
-                                            existing_oa=existing_oa, existing_sa=existing_sa,
-                                            existing_ma=existing_ma, existing_cash=existing_cash,
-                                            investment_current_age=investment_current_age)
-        cpf_balance_no_investment = calculate_cpf_balance_without_investment(
-            salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age, milestones,
-            existing_oa=existing_oa, existing_sa=existing_sa, existing_ma=existing_ma, existing_cash=existing_cash
-        )
-        df = pd.DataFrame(cpf_balance)
-        df_no_investment = pd.DataFrame(cpf_balance_no_investment)
+    st.subheader("Investment Return Simulation")
+    run_simulation = st.checkbox("Simulate investment returns (Monte Carlo)")
+    if run_simulation:
+        return_distribution = st.selectbox("Select the return distribution:", RETURN_DISTRIBUTIONS)
+        return_volatility = st.number_input("Enter the annual return volatility (as a percentage):", min_value=0.0,
+                                            step=0.5, value=15.0)
+        degrees_of_freedom = 5
+        historical_returns = None
+        if return_distribution == "student_t":
+            degrees_of_freedom = st.number_input("Enter the degrees of freedom for the return distribution:",
+                                                 min_value=3, step=1, value=5)
+        elif return_distribution == "bootstrap":
+            historical_returns_text = st.text_input("Enter historical annual returns (as percentages, comma separated):")
+            try:
+                historical_returns = [float(value) for value in historical_returns_text.split(",") if value.strip()]
+            except ValueError:
+                st.warning("Historical returns must be numbers separated by commas, e.g. 7.5, -3, 12.")
+        simulation_paths = st.number_input("Enter the number of simulated paths:", min_value=1000, step=1000,
+                                           value=100000)
 
-        # Add Year column based on current year
-        df['Year'] = df['Age'].apply(lambda age: current_year + (age - current_age))
-        df_no_investment['Year'] = df_no_investment['Age'].apply(lambda age: current_year + (age - current_age))
+    if st.button("Calculate"):
+        profile = st.session_state.profile_data["person_1"]
+        cpf_balance, cpf_balance_no_investment = PROJECTION_CACHE.get_or_compute(
+            projection_key(profile), lambda: st.session_state.projections["person_1"].update(profile))
+        # DataFrames with the Year column as calendar years
+        df = cpf_balance.to_pandas(current_year)
+        df_no_investment = cpf_balance_no_investment.to_pandas(current_year)
 
         # Format DataFrame for better readability
         df_formatted = df.style.format({
@@ -491,16 +351,124 @@ if analysis_type == 'Single':
 
             st.table(summary_df_display)
 
+            # Rank the inputs by how much a 10% increase in each would change the final net worth
+            _, sensitivities = net_worth_sensitivities(st.session_state.profile_data["person_1"])
+            sensitivity_labels = {
+                "salary": "Monthly Gross Income",
+                "bonus": "Annual Bonus",
+                "thirteenth_month": "13th Month Salary",
+                "monthly_expenses": "Monthly Expenses",
+                "annual_investment_premium": "Annual Investment Premium",
+                "annual_interest_rate": "Annual Interest Rate (per percentage point)",
+                "existing_oa": "Existing OA Balance",
+                "existing_sa": "Existing SA Balance",
+                "existing_ma": "Existing MA Balance",
+                "existing_cash": "Existing Cash Balance"
+            }
+            sensitivity_df = pd.DataFrame({
+                "Input": [sensitivity_labels[field] for field in SENSITIVITY_FIELDS],
+                "Net Worth Change per Unit": [sensitivities[field] for field in SENSITIVITY_FIELDS],
+                "Net Worth Change for a 10% Increase": [
+                    sensitivities[field] * st.session_state.profile_data["person_1"][field] * 0.1
+                    for field in SENSITIVITY_FIELDS]
+            }).sort_values("Net Worth Change for a 10% Increase", key=abs, ascending=False)
+            st.write("What Moves Your Net Worth the Most:")
+            st.table(sensitivity_df.style.format({
+                "Net Worth Change per Unit": "{:,.2f}",
+                "Net Worth Change for a 10% Increase": "${:,.2f}"
+            }))
+
             # Plot Net Worth Over Time (With and Without Investment)
             fig = go.Figure()
             fig.add_trace(
                 go.Scatter(x=df['Age'], y=df['Net Worth'], mode='lines+markers', name='Net Worth (With Investment)'))
             fig.add_trace(go.Scatter(x=df_no_investment['Age'], y=df_no_investment['Net Worth'], mode='lines+markers',
                                      name='Net Worth (Without Investment)'))
+            if run_simulation and (return_distribution != "bootstrap" or historical_returns):
+                simulation = simulate_cpf_balance_streaming(
+                    salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                    annual_investment_premium, annual_interest_rate, milestones, existing_oa=existing_oa,
+                    existing_sa=existing_sa, existing_ma=existing_ma, existing_cash=existing_cash,
+                    investment_current_age=investment_current_age, paths=simulation_paths,
+                    volatility=return_volatility, distribution=return_distribution,
+                    degrees_of_freedom=degrees_of_freedom, historical_returns=historical_returns)
+                fig.add_trace(go.Scatter(x=simulation['Age'], y=simulation['Net Worth P95'], mode='lines',
+                                         line=dict(width=0), showlegend=False))
+                fig.add_trace(go.Scatter(x=simulation['Age'], y=simulation['Net Worth P5'], mode='lines',
+                                         line=dict(width=0), fill='tonexty',
+                                         name='Net Worth 5th-95th Percentile (Simulated)'))
+                fig.add_trace(go.Scatter(x=simulation['Age'], y=simulation['Net Worth P50'], mode='lines',
+                                         line=dict(dash='dash'), name='Median Net Worth (Simulated)'))
             fig.update_layout(title=f"{name_1}'s Net Worth Over Time", xaxis_title='Age', yaxis_title='Amount ($)',
                               template='plotly_white')
             st.plotly_chart(fig)
 
+    st.subheader("Parameter Sweep")
+    run_sweep = st.checkbox("Sweep interest rate, investment premium and projected age")
+    if run_sweep:
+        sweep_rate_min = st.number_input("Enter the lowest annual interest rate for the sweep (as a percentage):",
+                                         min_value=0.0, step=0.1, value=0.0)
+        sweep_rate_max = st.number_input("Enter the highest annual interest rate for the sweep (as a percentage):",
+                                         min_value=0.0, step=0.1, value=max(annual_interest_rate, 10.0))
+        sweep_rate_steps = st.number_input("Enter the number of interest rate steps:", min_value=2, step=1, value=50)
+        sweep_premium_min = st.number_input("Enter the lowest annual investment premium for the sweep:",
+                                            min_value=0.0, step=100.0, value=0.0)
+        sweep_premium_max = st.number_input("Enter the highest annual investment premium for the sweep:",
+                                            min_value=0.0, step=100.0, value=max(annual_investment_premium, 10000.0))
+        sweep_premium_steps = st.number_input("Enter the number of investment premium steps:", min_value=2, step=1,
+                                              value=50)
+        sweep_age_min = st.number_input("Enter the lowest projected age for the sweep:", min_value=0, step=1,
+                                        value=projected_age)
+        sweep_age_max = st.number_input("Enter the highest projected age for the sweep:", min_value=0, step=1,
+                                        value=projected_age)
+
+        sweep_rates = np.linspace(sweep_rate_min, sweep_rate_max, sweep_rate_steps)
+        sweep_premiums = np.linspace(sweep_premium_min, sweep_premium_max, sweep_premium_steps)
+        sweep_ages = np.arange(sweep_age_min, max(sweep_age_min, sweep_age_max) + 1)
+        sweep_grid = sweep_final_net_worth(
+            salary, bonus, thirteenth_month, monthly_expenses, current_age, milestones, sweep_rates, sweep_premiums,
+            sweep_ages, existing_oa=existing_oa, existing_sa=existing_sa, existing_ma=existing_ma,
+            existing_cash=existing_cash, investment_current_age=investment_current_age)
+
+        sweep_age_shown = st.select_slider("Select the projected age to display:", options=sweep_ages.tolist(),
+                                           value=int(sweep_ages[-1]))
+        sweep_table = pd.DataFrame(sweep_grid[:, :, sweep_age_shown - sweep_ages[0]],
+                                   index=pd.Index(np.round(sweep_rates, 2), name="Interest Rate (%)"),
+                                   columns=pd.Index(np.round(sweep_premiums, 2), name="Annual Premium"))
+        fig_sweep = go.Figure(go.Heatmap(z=sweep_table.values, x=sweep_table.columns, y=sweep_table.index,
+                                         colorbar=dict(title='Net Worth ($)')))
+        fig_sweep.update_layout(title=f"{name_1}'s Net Worth at Age {sweep_age_shown}",
+                                xaxis_title='Annual Investment Premium ($)', yaxis_title='Interest Rate (%)',
+                                template='plotly_white')
+        st.plotly_chart(fig_sweep)
+        with st.expander("Net Worth Sweep Table"):
+            st.write(sweep_table.style.format("${:,.2f}"))
+
+    st.subheader("Goal Seek")
+    goal_seek_labels = {
+        "Annual investment premium": "annual_investment_premium",
+        "Monthly expenses": "monthly_expenses",
+        "Monthly gross income": "salary",
+        "Projected age": "projected_age"
+    }
+    run_goal_seek = st.checkbox("Solve for the input needed to reach a net worth target")
+    if run_goal_seek:
+        goal_label = st.selectbox("Select the input to solve for:", list(goal_seek_labels))
+        goal_net_worth = st.number_input("Enter your target net worth:", min_value=0.0, step=10000.0, value=1000000.0)
+        goal_age = projected_age
+        if goal_seek_labels[goal_label] != "projected_age":
+            goal_age = st.number_input("Enter the age by which to reach the target:", min_value=0, step=1,
+                                       value=projected_age)
+        goal_value = goal_seek(st.session_state.profile_data["person_1"], goal_net_worth,
+                               goal_seek_labels[goal_label], target_age=goal_age)
+        if goal_value is None:
+            st.warning(f"The target of ${goal_net_worth:,.2f} cannot be reached by changing the {goal_label.lower()}.")
+        elif goal_seek_labels[goal_label] == "projected_age":
+            st.success(f"{name_1} reaches a net worth of ${goal_net_worth:,.2f} at age {goal_value}.")
+        else:
+            st.success(f"Required {goal_label.lower()} to reach ${goal_net_worth:,.2f} by age {goal_age}: "
+                       f"${goal_value:,.2f}")
+
 elif analysis_type == 'Couple':
     # Current Year Input
     current_year = st.number_input("Enter the current year:", min_value=1900, step=1, value=2025)
@@ -559,7 +527,8 @@ elif analysis_type == 'Couple':
         step=1,
         key=f"num_milestones_1"  # Unique key for Person 1's milestone count
     )
-    milestones_1 = {}
+    # Milestones as a list of events, so two milestones at the same age add up instead of overwriting
+    milestones_1 = []
     for i in range(num_milestones_1):
         age = st.number_input(
             f"Enter the age for milestone {i + 1} ({name_1}'s age):",
@@ -572,7 +541,9 @@ elif analysis_type == 'Couple':
             step=100.0,
             key=f"amount_1_{i}"  # Unique key for Person 1's milestone amount
         )
-        milestones_1[age] = amount
+        milestones_1.append({"age": age, "amount": amount})
+    st.write("Recurring milestones (negative for expenses, positive for gains), growing by the escalation rate each year:")
+    milestones_1.extend(recurring_milestone_editor("recurring_milestones_1"))
 
     # Person 2 inputs
     st.subheader("Person 2")
@@ -622,14 +593,17 @@ elif analysis_type == 'Couple':
 
     st.subheader(f"Financial Milestones for {name_2}")
     num_milestones_2 = st.number_input(f"Enter the number of financial milestones for {name_2}:", min_value=0, step=1)
-    milestones_2 = {}
+    # Milestones as a list of events, so two milestones at the same age add up instead of overwriting
+    milestones_2 = []
     for i in range(num_milestones_2):
         age = st.number_input(f"Enter the age for milestone {i + 1} ({name_2}'s age):", min_value=0, step=1,
                               key=f"age_2_{i}")
         amount = st.number_input(
             f"Enter the amount for milestone {i + 1} (negative for expenses, positive for gains):", step=100.0,
             key=f"amount_2_{i}")
-        milestones_2[age] = amount
+        milestones_2.append({"age": age, "amount": amount})
+    st.write("Recurring milestones (negative for expenses, positive for gains), growing by the escalation rate each year:")
+    milestones_2.extend(recurring_milestone_editor("recurring_milestones_2"))
 
     # Update session state with current inputs
     st.session_state.profile_data["person_1"] = {
@@ -668,79 +642,21 @@ elif analysis_type == 'Couple':
     }
 
     if st.button("Calculate"):
-        # Calculate CPF balance for Person 1 (with and without investment)
-        cpf_balance_1 = calculate_cpf_balance(
-            salary=salary_1,
-            bonus=bonus_1,
-            thirteenth_month=thirteenth_month_1,
-            monthly_expenses=monthly_expenses_1,
-            current_age=current_age_1,
-            projected_age=projected_age_1,
-            annual_investment_premium=annual_investment_premium_1,
-            annual_interest_rate=annual_interest_rate_1,
-            milestones=milestones_1,
-            existing_oa=existing_oa_1,
-            existing_sa=existing_sa_1,
-            existing_ma=existing_ma_1,
-            existing_cash=existing_cash_1,
-            investment_current_age=investment_current_age_1
-        )
-        cpf_balance_1_no_investment = calculate_cpf_balance_without_investment(
-            salary=salary_1,
-            bonus=bonus_1,
-            thirteenth_month=thirteenth_month_1,
-            monthly_expenses=monthly_expenses_1,
-            current_age=current_age_1,
-            projected_age=projected_age_1,
-            milestones=milestones_1,
-            existing_oa=existing_oa_1,
-            existing_sa=existing_sa_1,
-            existing_ma=existing_ma_1,
-            existing_cash=existing_cash_1
-        )
-
-        # Calculate CPF balance for Person 2 (with and without investment)
-        cpf_balance_2 = calculate_cpf_balance(
-            salary=salary_2,
-            bonus=bonus_2,
-            thirteenth_month=thirteenth_month_2,
-            monthly_expenses=monthly_expenses_2,
-            current_age=current_age_2,
-            projected_age=projected_age_2,
-            annual_investment_premium=annual_investment_premium_2,
-            annual_interest_rate=annual_interest_rate_2,
-            milestones=milestones_2,
-            existing_oa=existing_oa_2,
-            existing_sa=existing_sa_2,
-            existing_ma=existing_ma_2,
-            existing_cash=existing_cash_2,
-            investment_current_age=investment_current_age_2
-        )
-        cpf_balance_2_no_investment = calculate_cpf_balance_without_investment(
-            salary=salary_2,
-            bonus=bonus_2,
-            thirteenth_month=thirteenth_month_2,
-            monthly_expenses=monthly_expenses_2,
-            current_age=current_age_2,
-            projected_age=projected_age_2,
-            milestones=milestones_2,
-            existing_oa=existing_oa_2,
-            existing_sa=existing_sa_2,
-            existing_ma=existing_ma_2,
-            existing_cash=existing_cash_2
-        )
-
-        # Convert results to DataFrames
-        df_1 = pd.DataFrame(cpf_balance_1)
-        df_1_no_investment = pd.DataFrame(cpf_balance_1_no_investment)
-        df_2 = pd.DataFrame(cpf_balance_2)
-        df_2_no_investment = pd.DataFrame(cpf_balance_2_no_investment)
-
-        # Add Year column based on current year
-        df_1['Year'] = df_1['Age'].apply(lambda age: current_year + (age - current_age_1))
-        df_1_no_investment['Year'] = df_1_no_investment['Age'].apply(lambda age: current_year + (age - current_age_1))
-        df_2['Year'] = df_2['Age'].apply(lambda age: current_year + (age - current_age_2))
-        df_2_no_investment['Year'] = df_2_no_investment['Age'].apply(lambda age: current_year + (age - current_age_2))
+        # Calculate CPF balance for Person 1 (cached by input hash, otherwise resumed from the first changed age)
+        profile_1 = st.session_state.profile_data["person_1"]
+        cpf_balance_1, cpf_balance_1_no_investment = PROJECTION_CACHE.get_or_compute(
+            projection_key(profile_1), lambda: st.session_state.projections["person_1"].update(profile_1))
+
+        # Calculate CPF balance for Person 2 (cached by input hash, otherwise resumed from the first changed age)
+        profile_2 = st.session_state.profile_data["person_2"]
+        cpf_balance_2, cpf_balance_2_no_investment = PROJECTION_CACHE.get_or_compute(
+            projection_key(profile_2), lambda: st.session_state.projections["person_2"].update(profile_2))
+
+        # Convert results to DataFrames with the Year column as calendar years
+        df_1 = cpf_balance_1.to_pandas(current_year)
+        df_1_no_investment = cpf_balance_1_no_investment.to_pandas(current_year)
+        df_2 = cpf_balance_2.to_pandas(current_year)
+        df_2_no_investment = cpf_balance_2_no_investment.to_pandas(current_year)
 
         # Align financial data for combined analysis
         df_combined = align_financial_data(df_1, df_2, current_year + (current_age_1 - current_age_1),
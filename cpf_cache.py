@@ -0,0 +1,238 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from cpf_engine import (CURVE_FIELDS, ENGINE_VERSION, PROFILE_DEFAULTS, CPFProjection, expand_milestone_events,
+                        get_cpf_rate_schedule, list_cpf_rate_schedules, load_cpf_rate_schedule, yearly_values)
+
+
+# SQLite file of the on-disk projection cache (override with the CPF_PROJECTION_CACHE environment variable)
+PROJECTION_CACHE_PATH = os.environ.get(
+    "CPF_PROJECTION_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "projection_cache", "projections.sqlite3"))
+
+
+# Hash of a rate schedule's version and rate bands, computed once per schedule
+@functools.lru_cache(maxsize=None)
+def rate_schedule_fingerprint(rate_schedule):
+    payload = [rate_schedule.version, [list(band) for band in rate_schedule.bands]]
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+# Fingerprints of the rate schedules currently shipped
+def current_rate_schedule_fingerprints():
+    return {rate_schedule_fingerprint(load_cpf_rate_schedule(path)) for path in list_cpf_rate_schedules().values()}
+
+# A constant or per-year curve input as the value of every projected year, collapsed to one number when it
+# does not change, so equivalent ways of writing it hash the same
+def canonical_curve(value, years):
+    values = np.broadcast_to(yearly_values(value, years), years).tolist() if np.ndim(value) else [float(value)]
+    return values[0] if len(set(values)) == 1 else values
+
+# Canonical hash of everything a projection depends on: the person's inputs (milestones as the total amount
+# at each month offset from the current age they fall on, however they were written), the rate schedule (version and rates) and
+# the engine version. Fields missing from the profile use the defaults, and keys the engine does not read
+# (like the name) are ignored.
+def projection_key(profile, rate_schedule=None):
+    rate_schedule = rate_schedule or get_cpf_rate_schedule()
+    inputs = {field: profile.get(field, default) for field, default in PROFILE_DEFAULTS.items()}
+    years = max(inputs["projected_age"] - inputs["current_age"] + 1, 0)
+    event_ages, event_months, amounts = expand_milestone_events(inputs["milestones"], inputs["current_age"],
+                                                                inputs["projected_age"])
+    # Total per (age, month), summed with bincount over the month offsets from current_age and hashed as raw
+    # bytes, so hundreds of recurring events do not have to go through JSON
+    offsets = (event_ages - inputs["current_age"]) * 12 + event_months
+    totals = np.bincount(offsets, weights=amounts)
+    with_events = np.flatnonzero(np.bincount(offsets))
+    inputs["milestones"] = hashlib.sha256(with_events.astype(np.int64).tobytes() +
+                                          totals[with_events].astype(float).tobytes()).hexdigest()
+    payload = {
+        "engine": ENGINE_VERSION,
+        "rate_schedule": rate_schedule_fingerprint(rate_schedule),
+        "inputs": {field: value if field == "milestones" else float(value) for field, value in inputs.items()
+                   if field not in CURVE_FIELDS},
+        "curves": {field: canonical_curve(inputs[field], years) for field in CURVE_FIELDS},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+# Make the arrays of a cached result read-only so callers cannot change what later hits return
+def freeze_result(result):
+    if isinstance(result, tuple):
+        return tuple(freeze_result(part) for part in result)
+    frozen = {}
+    for column, values in result.items():
+        values = np.asarray(values)
+        values.setflags(write=False)
+        frozen[column] = values
+    return CPFProjection(frozen)
+
+# Serialize a projection result (a CPFProjection or a tuple of them) to a JSON header and the raw column bytes,
+# and back. Loading only slices the stored buffer, so nothing is unpickled or copied.
+def dump_result(result):
+    parts = result if isinstance(result, tuple) else (result,)
+    header, chunks = [], []
+    for part in parts:
+        header.append([])
+        for column, values in part.items():
+            values = np.ascontiguousarray(values)
+            header[-1].append([column, values.dtype.str, values.size])
+            chunks.append(values.tobytes())
+    return json.dumps({"tuple": isinstance(result, tuple), "parts": header}), b"".join(chunks)
+
+def load_result(header, blob):
+    header = json.loads(header)
+    parts, offset = [], 0
+    for columns in header["parts"]:
+        part = {}
+        for column, dtype, size in columns:
+            part[column] = np.frombuffer(blob, dtype=dtype, count=size, offset=offset)
+            offset += part[column].nbytes
+        parts.append(CPFProjection(part))
+    return tuple(parts) if header["tuple"] else parts[0]
+
+# Projection results persisted in SQLite so they survive app restarts. Rows record the engine version and the
+# rate schedule fingerprint they were computed with; opening the cache deletes rows from another engine version
+# or from a schedule that is no longer shipped. At most max_entries rows are kept (oldest dropped first), trimmed
+# on open and every TRIM_INTERVAL writes.
+# Disk errors are treated as misses so a broken cache never stops a projection.
+class DiskProjectionCache:
+    TRIM_INTERVAL = 1000
+
+    def __init__(self, path=PROJECTION_CACHE_PATH, max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    # Open the database on first use, so importing the module never touches the disk
+    def connection(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS projections (key TEXT PRIMARY KEY, engine_version TEXT NOT NULL, "
+                "rate_schedule TEXT NOT NULL, header TEXT NOT NULL, result BLOB NOT NULL, created REAL NOT NULL)")
+            fingerprints = sorted(current_rate_schedule_fingerprints())
+            connection.execute(
+                f"DELETE FROM projections WHERE engine_version != ? OR rate_schedule NOT IN "
+                f"({', '.join('?' * len(fingerprints)) or 'NULL'})", [ENGINE_VERSION] + fingerprints)
+            self.trim(connection)
+            self._connection = connection
+        return self._connection
+
+    def trim(self, connection):
+        connection.execute("DELETE FROM projections WHERE key IN (SELECT key FROM projections ORDER BY created DESC "
+                           "LIMIT -1 OFFSET ?)", (self.max_entries,))
+        connection.commit()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                row = self.connection().execute(
+                    "SELECT header, result FROM projections WHERE key = ?", (key,)).fetchone()
+            except (sqlite3.Error, OSError):
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return load_result(row[0], row[1])
+
+    def put(self, key, result, rate_schedule=None):
+        header, blob = dump_result(result)
+        fingerprint = rate_schedule_fingerprint(rate_schedule or get_cpf_rate_schedule())
+        with self._lock:
+            try:
+                connection = self.connection()
+                connection.execute("INSERT OR REPLACE INTO projections VALUES (?, ?, ?, ?, ?, ?)",
+                                   (key, ENGINE_VERSION, fingerprint, header, blob, time.time()))
+                connection.commit()
+                self._writes += 1
+                if self._writes % self.TRIM_INTERVAL == 0:
+                    self.trim(connection)
+            except (sqlite3.Error, OSError):
+                pass
+
+    def clear(self):
+        with self._lock:
+            self.connection().execute("DELETE FROM projections")
+            self.connection().commit()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+# Bounded in-memory LRU cache of projection results keyed by projection_key, with hit / miss counters.
+# One instance is shared by all sessions of the app process, so memory stays capped at maxsize results.
+# With a disk_cache, in-memory misses are looked up on disk before computing, and new results are written to both.
+class ProjectionCache:
+    def __init__(self, maxsize=256, disk_cache=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.disk_cache = disk_cache
+        self.hits = 0
+        self.misses = 0
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._results:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+
+    def put(self, key, result):
+        result = freeze_result(result)
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    # Return the cached result for key, or call compute() and cache what it returns
+    def get_or_compute(self, key, compute, rate_schedule=None):
+        result = self.get(key)
+        if result is None and self.disk_cache is not None:
+            result = self.disk_cache.get(key)
+            if result is not None:
+                result = self.put(key, result)
+        if result is None:
+            result = self.put(key, compute())
+            if self.disk_cache is not None:
+                self.disk_cache.put(key, result, rate_schedule)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._results), "maxsize": self.maxsize}
+
+
+# Process-wide cache used by the app, backed by the on-disk cache
+PROJECTION_CACHE = ProjectionCache(disk_cache=DiskProjectionCache())
@@ -0,0 +1,1119 @@
+import functools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Folder with the versioned CPF rate schedules (cpf_<version>.json, or .yaml / .yml when PyYAML is installed)
+RATE_SCHEDULE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rate_schedules")
+
+# Ages covered by the compiled rate tables; older ages use the last row
+CPF_RATE_TABLE_AGE = 120
+
+# Version of the projection maths; bump it whenever a change alters projected values so cached results are dropped
+ENGINE_VERSION = "1"
+
+# CPF contribution and allocation rates of one rate year, compiled into age-indexed arrays.
+# Each band applies from its start age until the next band starts; the last band is open-ended.
+class CPFRateSchedule:
+    def __init__(self, version, band_starts, allocation_rates, contribution_rates):
+        band_starts = [int(age) for age in band_starts]
+        if not band_starts or band_starts[0] != 0 or any(b <= a for a, b in zip(band_starts, band_starts[1:])):
+            raise ValueError("Rate bands must start at age 0 and be in increasing age order.")
+        allocation_rates = np.array(allocation_rates, dtype=float)
+        contribution_rates = np.array(contribution_rates, dtype=float)
+        if allocation_rates.shape != (len(band_starts), 3) or contribution_rates.shape != (len(band_starts), 3):
+            raise ValueError("Every rate band needs OA/SA/MA allocation and employer/employee/total contribution rates.")
+
+        self.version = str(version)
+        band_index = np.searchsorted(band_starts, np.arange(CPF_RATE_TABLE_AGE + 1), side='right') - 1
+        self.allocation = allocation_rates[band_index]
+        self.contribution = contribution_rates[band_index]
+        self.allocation.flags.writeable = False
+        self.contribution.flags.writeable = False
+        self.allocation_rows = [tuple(row) for row in self.allocation.tolist()]
+        self.contribution_rows = [tuple(row) for row in self.contribution.tolist()]
+        # (start age, end age, (OA, SA, MA) allocation, (employer, employee, total) contribution) per band
+        band_ends = [start - 1 for start in band_starts[1:]] + [float('inf')]
+        self.bands = tuple((start, end, tuple(allocation), tuple(contribution))
+                           for start, end, allocation, contribution
+                           in zip(band_starts, band_ends, allocation_rates.tolist(), contribution_rates.tolist()))
+
+    # Build a schedule from its JSON / YAML document
+    @classmethod
+    def from_dict(cls, data):
+        bands = sorted(data["bands"], key=lambda band: band["start_age"])
+        return cls(
+            data["version"],
+            [band["start_age"] for band in bands],
+            [(band["allocation"]["oa"], band["allocation"]["sa"], band["allocation"]["ma"]) for band in bands],
+            [(band["contribution"]["employer"], band["contribution"]["employee"], band["contribution"]["total"])
+             for band in bands])
+
+    # OA, SA and MA allocation rates for one age
+    def allocation_rates(self, age):
+        return self.allocation_rows[min(max(int(age), 0), CPF_RATE_TABLE_AGE)]
+
+    # Employer, employee and total contribution rates for one age
+    def contribution_rates(self, age):
+        return self.contribution_rows[min(max(int(age), 0), CPF_RATE_TABLE_AGE)]
+
+    # Allocation and contribution rates gathered for an array of ages, shape ages.shape + (3,)
+    def rates_for_ages(self, ages):
+        index = np.clip(ages, 0, CPF_RATE_TABLE_AGE)
+        return self.allocation[index], self.contribution[index]
+
+# Load and compile a rate schedule file; compiled schedules are cached and shared across sessions
+@functools.lru_cache(maxsize=None)
+def load_cpf_rate_schedule(path):
+    with open(path, "r") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            return CPFRateSchedule.from_dict(yaml.safe_load(f))
+        return CPFRateSchedule.from_dict(json.load(f))
+
+# Rate schedule files in RATE_SCHEDULE_DIR keyed by version
+def list_cpf_rate_schedules():
+    if not os.path.exists(RATE_SCHEDULE_DIR):
+        return {}
+    schedules = {}
+    for file_name in sorted(os.listdir(RATE_SCHEDULE_DIR)):
+        name, extension = os.path.splitext(file_name)
+        if name.startswith("cpf_") and extension in (".json", ".yaml", ".yml"):
+            schedules[name[len("cpf_"):]] = os.path.join(RATE_SCHEDULE_DIR, file_name)
+    return schedules
+
+# Rate schedule for a version, or the latest version shipped when version is None
+@functools.lru_cache(maxsize=None)
+def get_cpf_rate_schedule(version=None):
+    schedules = list_cpf_rate_schedules()
+    if not schedules:
+        raise FileNotFoundError(f"No CPF rate schedules found in {RATE_SCHEDULE_DIR}")
+    if version is None:
+        version = max(schedules)
+    elif str(version) not in schedules:
+        raise ValueError(f"Unknown CPF rate schedule version: {version}")
+    return load_cpf_rate_schedule(schedules[str(version)])
+
+# CPF allocation rates based on age
+def get_cpf_allocation_rates(age, rate_schedule=None):
+    return (rate_schedule or get_cpf_rate_schedule()).allocation_rates(age)
+
+# CPF contribution rates based on age
+def get_cpf_rates(age, rate_schedule=None):
+    return (rate_schedule or get_cpf_rate_schedule()).contribution_rates(age)
+
+# Milestones as an event timeline: parallel arrays of the age each event (first) happens at, the month within
+# that year of age (0-11, for monthly projections), the amount, the recurrence interval in years (0 = once),
+# the last age a recurring event repeats at (-1 = until the end of the projection) and the escalation rate, the
+# yearly percentage growth of a recurring amount from its first age. Accepts the legacy {age: amount} dict
+# (string ages from JSON profiles included), a list of (age, amount) pairs or of event dicts with "age" (or
+# "start_age") and "amount" and optional "month", "every", "until" (or "end_age") and "escalation", or a
+# timeline built here. Several events may share an age; their amounts add up.
+def milestone_events(milestones):
+    if isinstance(milestones, dict) and "amount" in milestones:
+        return milestones
+    if isinstance(milestones, dict):
+        events = [{"age": age, "amount": amount} for age, amount in milestones.items()]
+    else:
+        events = [event if isinstance(event, dict) else {"age": event[0], "amount": event[1]}
+                  for event in milestones]
+    events = [dict(event, age=event.get("age", event.get("start_age")), until=event.get("until", event.get("end_age")))
+              for event in events]
+    for event in events:
+        if (event.get("every") or 0) < 0:
+            raise ValueError("Milestone recurrence interval must not be negative")
+        if not 0 <= (event.get("month") or 0) <= 11:
+            raise ValueError("Milestone month must be between 0 and 11")
+        if (event.get("escalation") or 0.0) <= -100:
+            raise ValueError("Milestone escalation rate must be above -100%")
+    return {
+        "age": np.array([int(event["age"]) for event in events], dtype=np.int64),
+        "month": np.array([int(event.get("month") or 0) for event in events], dtype=np.int64),
+        "amount": np.array([float(event["amount"]) for event in events]),
+        "every": np.array([int(event.get("every") or 0) for event in events], dtype=np.int64),
+        "until": np.array([-1 if event.get("until") is None else int(event["until"]) for event in events],
+                          dtype=np.int64),
+        "escalation": np.array([float(event.get("escalation") or 0.0) for event in events])
+    }
+
+# First occurrence on or after first_age, number of occurrences up to last_age and amount of that first
+# occurrence (escalated for the repeats skipped before first_age) of every timeline event
+def milestone_occurrence_range(events, first_age, last_age):
+    ages, every = events["age"], events["every"]
+    until = np.where((every > 0) & (events["until"] >= 0), np.minimum(events["until"], last_age), last_age)
+    # Occurrences before first_age are skipped by starting at the first repeat on or after it
+    skipped = np.where((every > 0) & (ages < first_age), -((ages - first_age) // np.maximum(every, 1)), 0)
+    start = ages + skipped * every
+    counts = np.where((start >= first_age) & (start <= until), (until - start) // np.maximum(every, 1) + 1, 0)
+    first_amount = events["amount"] * (1 + events["escalation"] / 100) ** (skipped * every)
+    return start, np.where(every > 0, counts, np.minimum(counts, 1)), first_amount
+
+# Every occurrence of the timeline's events between first_age and last_age (inclusive; one value, or one
+# per event), unrolled in bulk with np.repeat, as arrays of (event index, age, month, amount)
+def unroll_milestone_events(events, first_age, last_age):
+    start, counts, first_amount = milestone_occurrence_range(events, first_age, last_age)
+    event = np.repeat(np.arange(len(start)), counts)
+    repeat = np.arange(len(event)) - np.repeat(np.cumsum(counts) - counts, counts)
+    years = repeat * events["every"][event]
+    amounts = first_amount[event] * (1 + events["escalation"][event] / 100) ** years
+    return event, start[event] + years, events["month"][event], amounts
+
+# Every occurrence of the timeline's events between first_age and last_age (inclusive), as arrays of
+# (age, month, amount)
+def expand_milestone_events(milestones, first_age, last_age):
+    return unroll_milestone_events(milestone_events(milestones), first_age, last_age)[1:]
+
+# The milestones of many profiles as one timeline, with the array of the profile (row) each event belongs
+# to. Legacy {age: amount} dicts go straight into one-off events; event lists of every profile are parsed
+# in a single milestone_events call.
+def combine_milestone_events(milestones_per_profile):
+    legacy_rows, legacy_ages, legacy_amounts = [], [], []
+    event_rows, events, timelines = [], [], []
+    for row, milestones in enumerate(milestones_per_profile):
+        if not milestones:
+            continue
+        if isinstance(milestones, dict) and "amount" in milestones:
+            timelines.append((row, milestones))
+        elif isinstance(milestones, dict):
+            legacy_rows.extend([row] * len(milestones))
+            legacy_ages.extend(milestones.keys())
+            legacy_amounts.extend(milestones.values())
+        else:
+            event_rows.extend([row] * len(milestones))
+            events.extend(milestones)
+    legacy = {
+        "age": np.array(legacy_ages, dtype=np.int64),
+        "month": np.zeros(len(legacy_ages), dtype=np.int64),
+        "amount": np.array(legacy_amounts, dtype=float),
+        "every": np.zeros(len(legacy_ages), dtype=np.int64),
+        "until": np.full(len(legacy_ages), -1, dtype=np.int64),
+        "escalation": np.zeros(len(legacy_ages))
+    }
+    parts = [legacy, milestone_events(events)] + [timeline for _, timeline in timelines]
+    rows = np.concatenate([np.array(legacy_rows, dtype=np.int64), np.array(event_rows, dtype=np.int64)] +
+                          [np.full(len(timeline["age"]), row) for row, timeline in timelines])
+    return rows, {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+# Milestone amounts over `periods` consecutive periods starting at first_age (periods_per_year 1 for years,
+# 12 for months). Every occurrence, recurring and escalating ones included, is unrolled in one bulk
+# np.repeat and scatter-added with a single bincount, so the cost grows with the number of occurrences
+# but hundreds of recurring events with distinct escalation rates still take one NumPy pass.
+def milestone_series(milestones, first_age, periods, periods_per_year=1):
+    series = np.zeros(periods)
+    if periods == 0:
+        return series
+    # The usual small {age: amount} dict is quicker to place with a plain loop
+    if isinstance(milestones, dict) and "amount" not in milestones:
+        for age, amount in milestones.items():
+            offset = (int(age) - first_age) * periods_per_year
+            if 0 <= offset < periods:
+                series[offset] += amount
+        return series
+    _, event_ages, event_months, amounts = unroll_milestone_events(
+        milestone_events(milestones), first_age, first_age + (periods - 1) // periods_per_year)
+    position = (event_ages - first_age) * periods_per_year + (event_months if periods_per_year == 12 else 0)
+    return series + np.bincount(position, weights=amounts, minlength=periods)[:periods]
+
+# Milestone amounts laid out on the projection's (consecutive) age axis
+def build_milestone_vector(ages, milestones):
+    return milestone_series(milestones, ages[0], len(ages)) if len(ages) else np.zeros(0)
+
+# Total milestone amount per age between first_age and last_age, {age: amount} for the ages with events,
+# summed with bincount over the offsets from first_age
+def milestone_totals(milestones, first_age, last_age):
+    event_ages, _, amounts = expand_milestone_events(milestones, first_age, last_age)
+    offsets = event_ages - first_age
+    totals = np.bincount(offsets, weights=amounts)
+    with_events = np.flatnonzero(np.bincount(offsets))
+    return dict(zip((with_events + first_age).tolist(), totals[with_events].tolist()))
+
+# Sum of the milestone amounts falling between first_age and last_age, with a plain loop for the usual
+# small {age: amount} dict
+def milestone_total(milestones, first_age, last_age):
+    if isinstance(milestones, dict) and "amount" not in milestones:
+        return sum(amount for age, amount in milestones.items() if first_age <= int(age) <= last_age)
+    return float(expand_milestone_events(milestones, first_age, last_age)[2].sum())
+
+# Projection inputs of a profile (the fields of st.session_state.profile_data["person_1"]) and their defaults
+PROFILE_DEFAULTS = {
+    "salary": 0.0,
+    "bonus": 0.0,
+    "thirteenth_month": 0.0,
+    "monthly_expenses": 0.0,
+    "current_age": 0,
+    "projected_age": 0,
+    "annual_investment_premium": 0.0,
+    "annual_interest_rate": 0.0,
+    "milestones": {},
+    "existing_oa": 0.0,
+    "existing_sa": 0.0,
+    "existing_ma": 0.0,
+    "existing_cash": 0.0,
+    "investment_current_age": 0
+}
+
+# Inputs that may also be given as per-year curves (first value at the current age) instead of constants
+CURVE_FIELDS = ("salary", "bonus", "thirteenth_month", "monthly_expenses")
+
+# A constant input is returned as is; a per-year curve becomes a float array of exactly `years` values along
+# its last axis, holding its last value past its end
+def yearly_values(value, years):
+    if np.ndim(value) == 0:
+        return value
+    values = np.asarray(value, dtype=float)
+    if values.shape[-1] == 0:
+        raise ValueError("Per-year curves need at least one value")
+    if values.shape[-1] >= years:
+        return values[..., :years]
+    return np.concatenate([values, np.repeat(values[..., -1:], years - values.shape[-1], axis=-1)], axis=-1)
+
+# Whether any salary, bonus, 13th month or expense input of a profile is a per-year curve. In a profile
+# (as in calculate_cpf_balance) an array for one of these fields is always a curve.
+def has_curves(inputs):
+    return any(np.ndim(inputs[field]) for field in CURVE_FIELDS)
+
+# Prefix sums of the yearly income (salary * 12 + bonus + 13th month) and yearly expenses over `years` years
+# along the last axis, to sum per-year curves over any run of years: years [first, first + n) add up to
+# p[..., first + n] - p[..., first]. Leading axes of the curves broadcast.
+def income_expense_prefix_sums(salary, bonus, thirteenth_month, monthly_expenses, years):
+    ones = np.ones(years)
+    income = (yearly_values(salary, years) * 12 + yearly_values(bonus, years)
+              + yearly_values(thirteenth_month, years)) * ones
+    expenses = yearly_values(monthly_expenses, years) * 12 * ones
+
+    def prefix_sums(values):
+        return np.concatenate([np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis=-1)], axis=-1)
+    return prefix_sums(income), prefix_sums(expenses)
+
+# Per-year curve generators for salary, bonus, 13th month and expenses, starting at the current age. Values
+# and rates may carry leading axes (e.g. growth_rate=np.array([1.0, 2.0, 3.0])[:, None]) to build the curves
+# of a whole sweep in one call, ready for calculate_cpf_balance_batch.
+
+# Fixed yearly growth: value * (1 + growth_rate%) ** year
+def fixed_growth_curve(value, years, growth_rate):
+    return value * (1 + np.asarray(growth_rate) / 100) ** np.arange(years)
+
+# Step promotions: a raise of promotion_raise% every promotion_every years, flat in between
+def step_promotion_curve(value, years, promotion_every, promotion_raise):
+    return value * (1 + np.asarray(promotion_raise) / 100) ** (np.arange(years) // np.asarray(promotion_every))
+
+# Career plateau: growth_rate% a year for plateau_after years, flat afterwards
+def career_plateau_curve(value, years, growth_rate, plateau_after):
+    return value * (1 + np.asarray(growth_rate) / 100) ** np.minimum(np.arange(years), np.asarray(plateau_after))
+
+# CPF accounts and cash savings before any investment premium, over an age grid: 1-D for one profile,
+# profiles x years for a batch. Inputs broadcast against the grid (salary, bonus, 13th month and expenses may
+# be per-year curves) and every cumulative column comes from cumsum along the last axis. This part is shared
+# by every investment scenario of the same person.
+def project_cpf_base(ages, milestone_amounts, salary, bonus, thirteenth_month, monthly_expenses,
+                     existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0, rate_schedule=None):
+    allocation, contribution = (rate_schedule or get_cpf_rate_schedule()).rates_for_ages(ages)
+    oa_rate, sa_rate, ma_rate = np.moveaxis(allocation, -1, 0)
+    employee_rate, total_rate = contribution[..., 1], contribution[..., 2]
+    salary, bonus, thirteenth_month, monthly_expenses = (
+        yearly_values(value, ages.shape[-1]) for value in (salary, bonus, thirteenth_month, monthly_expenses))
+
+    annual_income = salary * 12 + bonus + thirteenth_month
+    cpf_contribution = annual_income * total_rate
+    net_annual_salary = ((salary * (1 - employee_rate)) - monthly_expenses) * 12 + (bonus * (1 - employee_rate)) + (
+        thirteenth_month * (1 - employee_rate))
+
+    cumulative_oa = existing_oa + np.cumsum(cpf_contribution * oa_rate, axis=-1)
+    cumulative_sa = existing_sa + np.cumsum(cpf_contribution * sa_rate, axis=-1)
+    cumulative_ma = existing_ma + np.cumsum(cpf_contribution * ma_rate, axis=-1)
+    return {
+        'Cumulative Cash Savings': existing_cash + np.cumsum(net_annual_salary + milestone_amounts, axis=-1),
+        'Cumulative OA': cumulative_oa,
+        'Cumulative SA': cumulative_sa,
+        'Cumulative MA': cumulative_ma,
+        'Cumulative Total CPF': cumulative_oa + cumulative_sa + cumulative_ma
+    }
+
+# Investment premiums and value; premium, rate and start age may carry extra leading axes to
+# evaluate several investment variants against the same ages in one call
+def project_investment(ages, annual_investment_premium, annual_interest_rate, investment_current_age=0,
+                       existing_investment=0.0):
+    # Annual investment premium only applies from the investment start age onwards
+    invested = ages >= investment_current_age
+    premiums = np.where(invested, annual_investment_premium, 0.0)
+    growth = np.where(invested, 1 + annual_interest_rate / 100, 1.0)
+    # value_t = (value_{t-1} + premium_t) * growth_t
+    #         == compounding_t * (existing_investment + sum(premium_s / compounding_{s-1}))
+    compounding = np.cumprod(growth, axis=-1)
+    return {
+        'Cumulative Investment Premium': np.cumsum(premiums, axis=-1),
+        'Investment Value': compounding * (existing_investment + np.cumsum(premiums * growth / compounding, axis=-1))
+    }
+
+# Full set of output columns from a shared base and one investment overlay
+def combine_cpf_projection(base, investment):
+    cumulative_cash_savings = base['Cumulative Cash Savings'] - investment['Cumulative Investment Premium']
+    return {
+        'Cumulative Cash Savings': cumulative_cash_savings,
+        'Cumulative OA': base['Cumulative OA'],
+        'Cumulative SA': base['Cumulative SA'],
+        'Cumulative MA': base['Cumulative MA'],
+        'Cumulative Total CPF': base['Cumulative Total CPF'],
+        'Cumulative Investment Premium': investment['Cumulative Investment Premium'],
+        'Investment Value': investment['Investment Value'],
+        'Net Worth': cumulative_cash_savings + base['Cumulative Total CPF'] + investment['Investment Value']
+    }
+
+# Core projection over an age grid with a single investment plan. Values are left unrounded so
+# callers that only need a few numbers can skip the rounding pass.
+def project_cpf_grid(ages, milestone_amounts, salary, bonus, thirteenth_month, monthly_expenses,
+                     annual_investment_premium, annual_interest_rate, existing_oa=0.0, existing_sa=0.0,
+                     existing_ma=0.0, existing_cash=0.0, investment_current_age=0, rate_schedule=None):
+    base = project_cpf_base(ages, milestone_amounts, salary, bonus, thirteenth_month, monthly_expenses,
+                            existing_oa=existing_oa, existing_sa=existing_sa, existing_ma=existing_ma,
+                            existing_cash=existing_cash, rate_schedule=rate_schedule)
+    return combine_cpf_projection(base, project_investment(ages, annual_investment_premium, annual_interest_rate,
+                                                           investment_current_age))
+
+# Vectorized projection for a single person
+def project_cpf_balance(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                        annual_investment_premium, annual_interest_rate, milestones,
+                        existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                        investment_current_age=0, rate_schedule=None):
+    ages = np.arange(current_age, projected_age + 1)
+    cpf_balance = {'Year': np.arange(1, len(ages) + 1), 'Age': ages}
+    cpf_balance.update(project_cpf_grid(
+        ages, build_milestone_vector(ages, milestones), salary, bonus, thirteenth_month, monthly_expenses,
+        float(annual_investment_premium), annual_interest_rate, existing_oa=existing_oa, existing_sa=existing_sa,
+        existing_ma=existing_ma, existing_cash=existing_cash, investment_current_age=investment_current_age,
+        rate_schedule=rate_schedule))
+    return cpf_balance
+
+# Profile table (list of profile dicts, or a DataFrame / dict of columns) as one array per field
+def profiles_to_columns(profiles):
+    if isinstance(profiles, (list, tuple)):
+        columns = {field: [profile.get(field, default) for profile in profiles]
+                   for field, default in PROFILE_DEFAULTS.items()}
+        for field, values in columns.items():
+            if field in CURVE_FIELDS and any(isinstance(value, (list, tuple, np.ndarray)) for value in values):
+                # Per-year curves of any length as one profiles x years matrix
+                years = max(np.size(value) for value in values)
+                columns[field] = np.stack([np.broadcast_to(yearly_values(value, years), years) for value in values])
+            elif field != "milestones":
+                columns[field] = np.array(values)
+        return columns
+    count = len(profiles[next(iter(profiles))]) if len(profiles) else 0
+    columns = {}
+    # Missing cells (NaN or None, e.g. a DataFrame built from dicts without some keys) take the defaults
+    for field, default in PROFILE_DEFAULTS.items():
+        if field not in profiles:
+            columns[field] = [{}] * count if field == "milestones" else np.full(count, default)
+        elif field == "milestones":
+            columns[field] = [value if isinstance(value, (dict, list, tuple)) else {} for value in profiles[field]]
+        else:
+            values = np.asarray(profiles[field])
+            if values.dtype == object:
+                values = np.array([default if np.ndim(value) == 0 and pd.isna(value) else value for value in values])
+            elif values.dtype.kind == "f":
+                values = np.where(np.isnan(values), default, values)
+            columns[field] = values
+    return columns
+
+# Batch projection: one call for many profiles, returned as profiles x years arrays.
+# Salary, bonus, 13th month and expenses may be per-year curves, as a profiles x years matrix in a dict of
+# columns (e.g. from fixed_growth_curve over a range of growth rates) or an array per profile dict.
+# Column j holds year j + 1 of each profile's own projection; cells past a profile's projected age are
+# masked (NaN for money columns, False in 'Valid') so ragged horizons share one grid without per-row loops.
+def calculate_cpf_balance_batch(profiles, rounded=True, rate_schedule=None):
+    columns = profiles_to_columns(profiles)
+    current_age = columns["current_age"].astype(int)
+    horizon = np.clip(columns["projected_age"].astype(int) - current_age + 1, 0, None)
+    years = int(horizon.max(initial=0))
+    offsets = np.arange(years)
+    ages = current_age[:, None] + offsets
+    valid = offsets < horizon[:, None]
+
+    # Every profile's milestones as one timeline, unrolled over each profile's own horizon and scattered
+    # into the grid with one add.at
+    milestone_amounts = np.zeros(ages.shape)
+    event_rows, events = combine_milestone_events(columns["milestones"])
+    event, event_ages, _, amounts = unroll_milestone_events(
+        events, current_age[event_rows], current_age[event_rows] + horizon[event_rows] - 1)
+    rows = event_rows[event]
+    np.add.at(milestone_amounts, (rows, event_ages - current_age[rows]), amounts)
+
+    # Constants become a column against the years axis; per-year curves (profiles x years) are used as is
+    def column(field):
+        values = columns[field].astype(float)
+        return values[:, None] if values.ndim == 1 else values
+
+    cpf_balance = {'Year': np.broadcast_to(offsets + 1, ages.shape), 'Age': ages, 'Valid': valid}
+    grid = project_cpf_grid(
+        ages, milestone_amounts, column("salary"), column("bonus"), column("thirteenth_month"),
+        column("monthly_expenses"), column("annual_investment_premium"), column("annual_interest_rate"),
+        existing_oa=column("existing_oa"), existing_sa=column("existing_sa"), existing_ma=column("existing_ma"),
+        existing_cash=column("existing_cash"), investment_current_age=column("investment_current_age"),
+        rate_schedule=rate_schedule)
+    for name, values in grid.items():
+        cpf_balance[name] = np.where(valid, np.round(values, 2) if rounded else values, np.nan)
+    return cpf_balance
+
+# sum(growth ** j for j in 1..years): value of one unit paid in at the start of each of `years` years
+def geometric_growth_factor(growth, years):
+    if np.ndim(growth) == 0:
+        return years if growth == 1 else growth * (growth ** years - 1) / (growth - 1)
+    growth = np.asarray(growth, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = growth * (growth ** years - 1) / (growth - 1)
+    return np.where(growth == 1, years, factor)
+
+# Closed-form state at the end of the year the person turns `age`, in O(number of rate bands).
+# Within a band CPF and cash accumulate linearly and the investment is a geometric series, so no
+# per-year table is built. Ages are scalars; money inputs may be NumPy arrays and broadcast.
+# With curves=True, salary, bonus, 13th month and expenses are per-year curves along their last axis
+# (first value at current_age, leading axes broadcast) and are summed over each band from prefix sums.
+# Ages before current_age give the opening balances. Values are unrounded.
+def solve_cpf_state_at_age(age, salary, bonus, thirteenth_month, monthly_expenses, current_age,
+                           annual_investment_premium, annual_interest_rate, milestones,
+                           existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                           investment_current_age=0, rate_schedule=None, curves=False):
+    if curves:
+        income_sums, expense_sums = income_expense_prefix_sums(salary, bonus, thirteenth_month, monthly_expenses,
+                                                               max(age - current_age + 1, 0))
+    else:
+        annual_income = salary * 12 + bonus + thirteenth_month
+    cumulative_cash_savings = existing_cash
+    cumulative_oa = existing_oa
+    cumulative_sa = existing_sa
+    cumulative_ma = existing_ma
+    bands = (rate_schedule or get_cpf_rate_schedule()).bands
+    for start, end, (oa_rate, sa_rate, ma_rate), (employer_rate, employee_rate, total_rate) in bands:
+        years = min(age, end) - max(current_age, start) + 1
+        if years <= 0:
+            continue
+        if curves:
+            first = max(current_age, start) - current_age
+            band_income = income_sums[..., first + years] - income_sums[..., first]
+            cpf_contribution = band_income * total_rate
+            cumulative_cash_savings = cumulative_cash_savings + band_income * (1 - employee_rate) - (
+                expense_sums[..., first + years] - expense_sums[..., first])
+        else:
+            cpf_contribution = annual_income * total_rate * years
+            net_annual_salary = ((salary * (1 - employee_rate)) - monthly_expenses) * 12 + (
+                bonus * (1 - employee_rate)) + (thirteenth_month * (1 - employee_rate))
+            cumulative_cash_savings = cumulative_cash_savings + net_annual_salary * years
+        cumulative_oa = cumulative_oa + cpf_contribution * oa_rate
+        cumulative_sa = cumulative_sa + cpf_contribution * sa_rate
+        cumulative_ma = cumulative_ma + cpf_contribution * ma_rate
+    cumulative_cash_savings = cumulative_cash_savings + milestone_total(milestones, current_age, age)
+
+    invested_years = max(age - max(current_age, investment_current_age) + 1, 0)
+    cumulative_investment_premium = annual_investment_premium * invested_years
+    investment_value = annual_investment_premium * geometric_growth_factor(1 + annual_interest_rate / 100,
+                                                                           invested_years)
+    cumulative_cash_savings = cumulative_cash_savings - cumulative_investment_premium
+    cumulative_total_cpf = cumulative_oa + cumulative_sa + cumulative_ma
+    return {
+        'Cumulative Cash Savings': cumulative_cash_savings,
+        'Cumulative OA': cumulative_oa,
+        'Cumulative SA': cumulative_sa,
+        'Cumulative MA': cumulative_ma,
+        'Cumulative Total CPF': cumulative_total_cpf,
+        'Cumulative Investment Premium': cumulative_investment_premium,
+        'Investment Value': investment_value,
+        'Net Worth': cumulative_cash_savings + cumulative_total_cpf + investment_value
+    }
+
+# Point query: balances of a profile (a dict with the profile_data fields) at one age, by default
+# its projected age, without building, rounding or tabulating the per-year projection. Arrays for salary,
+# bonus, 13th month or expenses are per-year curves, as in calculate_cpf_balance.
+# `columns` selects the output: one column name returns a single value, a list returns a dict.
+def state_at(profile, age=None, columns=None, rate_schedule=None):
+    inputs = {field: profile.get(field, default) for field, default in PROFILE_DEFAULTS.items()
+              if field != "projected_age"}
+    state = solve_cpf_state_at_age(profile.get("projected_age", 0) if age is None else age, **inputs,
+                                   rate_schedule=rate_schedule, curves=has_curves(inputs))
+    if columns is None:
+        return state
+    if isinstance(columns, str):
+        return state[columns]
+    return {column: state[column] for column in columns}
+
+# Final net worth over a Cartesian grid of investment rates x premiums x projected (retirement) ages, as an
+# array of that shape. Cash and CPF do not depend on the investment, so one base projection up to the
+# oldest age is shared by every point; the investment adds premium * (growth factor - invested years).
+def sweep_final_net_worth(salary, bonus, thirteenth_month, monthly_expenses, current_age, milestones,
+                          annual_interest_rates, annual_investment_premiums, projected_ages,
+                          existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                          investment_current_age=0, rate_schedule=None):
+    rates = np.asarray(annual_interest_rates, dtype=float)[:, None, None]
+    premiums = np.asarray(annual_investment_premiums, dtype=float)[None, :, None]
+    projected_ages = np.asarray(projected_ages, dtype=int)
+
+    ages = np.arange(current_age, max(int(projected_ages.max(initial=current_age)), current_age) + 1)
+    base = project_cpf_base(ages, build_milestone_vector(ages, milestones), salary, bonus, thirteenth_month,
+                            monthly_expenses, existing_oa=existing_oa, existing_sa=existing_sa,
+                            existing_ma=existing_ma, existing_cash=existing_cash, rate_schedule=rate_schedule)
+    # Row 0 holds the opening balance for projected ages before current_age
+    base_net_worth = np.r_[existing_cash + existing_oa + existing_sa + existing_ma,
+                           base['Cumulative Cash Savings'] + base['Cumulative Total CPF']]
+    index = np.clip(projected_ages - current_age + 1, 0, len(ages))
+    invested_years = np.clip(projected_ages - max(current_age, investment_current_age) + 1, 0, None)
+    growth = geometric_growth_factor(1 + rates / 100, invested_years[None, None, :])
+    return base_net_worth[index][None, None, :] + premiums * (growth - invested_years[None, None, :])
+
+# Earliest age at which `column` ('Net Worth', 'Cumulative Total CPF', 'Investment Value', ...) reaches
+# `threshold` for every profile of a batch, as a float array with NaN where it is never reached.
+# `threshold` may be one amount or one per profile. The search runs up to each projected age, or up to
+# `max_age` for every profile when given, as one masked argmax over the unrounded batch projection.
+def first_age_reaching_batch(profiles, threshold, column='Net Worth', max_age=None, rate_schedule=None):
+    columns = profiles_to_columns(profiles)
+    if max_age is not None:
+        columns["projected_age"] = np.full(len(columns["current_age"]), max_age)
+    batch = calculate_cpf_balance_batch(columns, rounded=False, rate_schedule=rate_schedule)
+    reached = batch['Valid'] & (batch[column] >= np.reshape(threshold, (-1, 1)))
+    first = reached.argmax(axis=1)
+    ages = columns["current_age"].astype(float) + first
+    return np.where(reached.any(axis=1), ages, np.nan)
+
+# Earliest age at which one profile's `column` reaches `threshold`, or None if it never does
+def first_age_reaching(profile, threshold, column='Net Worth', max_age=None, rate_schedule=None):
+    age = first_age_reaching_batch([profile], threshold, column=column, max_age=max_age,
+                                   rate_schedule=rate_schedule)[0]
+    return None if np.isnan(age) else int(age)
+
+# Profile fields the goal-seek solver can solve for
+GOAL_SEEK_FIELDS = ("annual_investment_premium", "monthly_expenses", "salary", "projected_age")
+
+# Goal seek: the value of one profile field (see GOAL_SEEK_FIELDS) that makes net worth at `target_age`
+# (default: the profile's projected age) equal `target_net_worth`. Money fields are solved with secant
+# iterations on the closed-form solver; net worth is linear in each of them, so this usually converges in
+# one step. A per-year salary or expense curve is solved for a uniform shift of every year (as in
+# net_worth_sensitivities) and the shifted curve is returned. For 'projected_age' the earliest age at which
+# net worth reaches the target is returned. Returns None when no non-negative value reaches the target.
+def goal_seek(profile, target_net_worth, solve_for, target_age=None, tolerance=0.01, max_iterations=50,
+              max_age=CPF_RATE_TABLE_AGE, rate_schedule=None):
+    if solve_for not in GOAL_SEEK_FIELDS:
+        raise ValueError(f"Cannot solve for {solve_for}; choose one of {', '.join(GOAL_SEEK_FIELDS)}.")
+    inputs = {field: profile.get(field, default) for field, default in PROFILE_DEFAULTS.items()}
+    if solve_for == "projected_age":
+        return first_age_reaching(inputs, target_net_worth, max_age=max_age, rate_schedule=rate_schedule)
+
+    projected_age = inputs.pop("projected_age")
+    age = projected_age if target_age is None else target_age
+
+    # Constants are solved for directly, curves for the shift added to every year
+    curve = np.asarray(inputs[solve_for], dtype=float) if np.ndim(inputs[solve_for]) else None
+
+    def value_of(shift):
+        return shift if curve is None else curve + shift
+
+    def shortfall(shift):
+        return solve_cpf_state_at_age(age, **dict(inputs, **{solve_for: value_of(shift)}), rate_schedule=rate_schedule,
+                                      curves=has_curves(inputs))['Net Worth'] - target_net_worth
+
+    previous = float(inputs[solve_for]) if curve is None else 0.0
+    current = previous + 1.0
+    previous_shortfall, current_shortfall = shortfall(previous), shortfall(current)
+    for _ in range(max_iterations):
+        if abs(current_shortfall) <= tolerance:
+            return value_of(current) if np.min(value_of(current)) >= 0 else None
+        if current_shortfall == previous_shortfall:
+            return None
+        previous, current = current, current - current_shortfall * (current - previous) / (
+            current_shortfall - previous_shortfall)
+        previous_shortfall, current_shortfall = current_shortfall, shortfall(current)
+    return None
+
+# Continuous profile fields that final net worth is differentiated against
+SENSITIVITY_FIELDS = ("salary", "bonus", "thirteenth_month", "monthly_expenses", "annual_investment_premium",
+                      "annual_interest_rate", "existing_oa", "existing_sa", "existing_ma", "existing_cash")
+
+# d/dgrowth of geometric_growth_factor(growth, years) = sum(j * growth ** (j - 1) for j in 1..years)
+def geometric_growth_factor_derivative(growth, years):
+    if growth == 1:
+        return years * (years + 1) / 2
+    return (((years + 1) * growth ** years - 1) * (growth - 1) - (growth ** (years + 1) - growth)) / (growth - 1) ** 2
+
+# Net worth of a profile at `age` (default: its projected age) together with its exact derivative with
+# respect to every field in SENSITIVITY_FIELDS, accumulated in the same band-by-band pass as the value
+# (forward mode). The rate derivative is per percentage point, like annual_interest_rate itself.
+# Returns (net_worth, {field: derivative}).
+def net_worth_sensitivities(profile, age=None, rate_schedule=None):
+    inputs = {field: profile.get(field, default) for field, default in PROFILE_DEFAULTS.items()}
+    age = inputs["projected_age"] if age is None else age
+    salary, bonus, thirteenth_month = inputs["salary"], inputs["bonus"], inputs["thirteenth_month"]
+    current_age = inputs["current_age"]
+    premium, rate = inputs["annual_investment_premium"], inputs["annual_interest_rate"]
+
+    net_worth = inputs["existing_oa"] + inputs["existing_sa"] + inputs["existing_ma"] + inputs["existing_cash"]
+    # Per-year curves: net worth sums them over each band, and their derivatives are for a shift of every year
+    curves = has_curves(inputs)
+    if curves:
+        income_sums, expense_sums = income_expense_prefix_sums(
+            salary, bonus, thirteenth_month, inputs["monthly_expenses"], max(age - current_age + 1, 0))
+    sensitivities = dict.fromkeys(SENSITIVITY_FIELDS, 0.0)
+    for field in ("existing_oa", "existing_sa", "existing_ma", "existing_cash"):
+        sensitivities[field] = 1.0
+    for start, end, allocation, (employer_rate, employee_rate, total_rate) in (
+            rate_schedule or get_cpf_rate_schedule()).bands:
+        years = min(age, end) - max(current_age, start) + 1
+        if years <= 0:
+            continue
+        # Each dollar of annual income adds its take-home share to cash and its allocated CPF share
+        kept = (1 - employee_rate) + total_rate * sum(allocation)
+        sensitivities["salary"] += 12 * kept * years
+        sensitivities["bonus"] += kept * years
+        sensitivities["thirteenth_month"] += kept * years
+        sensitivities["monthly_expenses"] -= 12 * years
+        if curves:
+            first = max(current_age, start) - current_age
+            net_worth += (income_sums[..., first + years] - income_sums[..., first]) * kept - (
+                expense_sums[..., first + years] - expense_sums[..., first])
+        else:
+            net_worth += ((salary * 12 + bonus + thirteenth_month) * kept - inputs["monthly_expenses"] * 12) * years
+    net_worth += milestone_total(inputs["milestones"], current_age, age)
+
+    invested_years = max(age - max(current_age, inputs["investment_current_age"]) + 1, 0)
+    growth = 1 + rate / 100
+    growth_factor = geometric_growth_factor(growth, invested_years)
+    net_worth += premium * (growth_factor - invested_years)
+    sensitivities["annual_investment_premium"] = growth_factor - invested_years
+    sensitivities["annual_interest_rate"] = premium * geometric_growth_factor_derivative(growth, invested_years) / 100
+    return net_worth, sensitivities
+
+# Money columns summed across people in a combined analysis
+COMBINED_COLUMNS = [
+    'Cumulative Cash Savings',
+    'Cumulative OA',
+    'Cumulative SA',
+    'Cumulative MA',
+    'Cumulative Total CPF',
+    'Cumulative Investment Premium',
+    'Investment Value',
+    'Net Worth'
+]
+
+# Household table: 'Year', the combined columns, then every member's own columns as "<column> (<name>)".
+# `values` is years x members x COMBINED_COLUMNS, already carried forward on the shared year axis.
+def build_household_frame(years, names, values, member_columns=True):
+    household = {'Year': years}
+    combined = values.sum(axis=1)
+    for index, column in enumerate(COMBINED_COLUMNS):
+        household[column] = combined[:, index]
+    if member_columns:
+        for member, name in enumerate(names):
+            for index, column in enumerate(COMBINED_COLUMNS):
+                household[f"{column} ({name})"] = values[:, member, index]
+    return pd.DataFrame(household)
+
+# Align any number of member projections (a dict of name -> DataFrame with a calendar 'Year' column, or a
+# list named Person 1..N) on a shared year axis. Each member is scattered into one years x members x columns
+# array, carried forward past the end of its projection (zero before it starts) and summed in one reduction.
+def align_household_data(members, start_year=None, member_columns=True):
+    if not isinstance(members, dict):
+        members = {f"Person {index + 1}": df for index, df in enumerate(members)}
+    min_year = min(int(df['Year'].iloc[0]) for df in members.values()) if start_year is None else int(start_year)
+    max_year = max(int(df['Year'].iloc[-1]) for df in members.values())
+    years = np.arange(min_year, max_year + 1)
+
+    values = np.full((len(years), len(members), len(COMBINED_COLUMNS)), np.nan)
+    for member, df in enumerate(members.values()):
+        rows = df['Year'].to_numpy(dtype=int) - min_year
+        inside = (rows >= 0) & (rows < len(years))
+        values[rows[inside], member] = df.reindex(columns=COMBINED_COLUMNS, fill_value=0.0).to_numpy(dtype=float)[inside]
+
+    # Forward-fill along the year axis from each member's last observed row
+    observed = ~np.isnan(values).all(axis=2)
+    last_row = np.maximum.accumulate(np.where(observed, np.arange(len(years))[:, None], -1), axis=0)
+    values = values[np.maximum(last_row, 0), np.arange(len(members))]
+    values = np.where((last_row >= 0)[..., None], np.nan_to_num(values), 0.0)
+    return build_household_frame(years, list(members), values, member_columns=member_columns)
+
+# Align financial data for combined analysis
+def align_financial_data(df1, df2, start_year_1, start_year_2):
+    return align_household_data([df1, df2], start_year=min(start_year_1, start_year_2), member_columns=False)
+
+# Household projection for any number of members who share the current calendar year. All members run
+# through the batch engine, so year j of every member falls on current_year + j; members whose projection
+# ends earlier keep their final balances.
+def calculate_household_balance(profiles, current_year, rate_schedule=None):
+    batch = calculate_cpf_balance_batch(profiles, rate_schedule=rate_schedule)
+    horizon = batch['Valid'].sum(axis=1)
+    last_year = np.maximum(np.minimum(np.arange(batch['Valid'].shape[1]), horizon[:, None] - 1), 0)
+    values = np.stack([np.take_along_axis(batch[column], last_year, axis=1) for column in COMBINED_COLUMNS], axis=-1)
+    values = np.where((horizon > 0)[:, None, None], values, 0.0).transpose(1, 0, 2)
+    names = [profile.get("name") or f"Person {index + 1}" for index, profile in enumerate(profiles)]
+    return build_household_frame(current_year + np.arange(values.shape[0]), names, values)
+
+# Projection result: a dict of one contiguous NumPy array per column, so existing code that indexes it or
+# passes it to pd.DataFrame keeps working. to_pandas() / to_arrow() wrap the arrays without copying and can
+# swap 'Year' for calendar years, computed from the ages instead of per row.
+class CPFProjection(dict):
+    __slots__ = ()
+
+    def __init__(self, columns):
+        super().__init__((column, np.ascontiguousarray(values)) for column, values in columns.items())
+
+    def __repr__(self):
+        rows = len(next(iter(self.values()))) if self else 0
+        return f"CPFProjection({rows} rows: {', '.join(self)})"
+
+    # Calendar year of every row when the first row falls in current_year
+    def calendar_years(self, current_year):
+        ages = self['Age']
+        return current_year + (ages - ages[..., :1])
+
+    # Same projection without some columns (the arrays are shared, not copied)
+    def without(self, *columns):
+        return CPFProjection({column: values for column, values in self.items() if column not in columns})
+
+    def column_arrays(self, current_year=None):
+        columns = dict(self)
+        if current_year is not None:
+            columns['Year'] = self.calendar_years(current_year)
+        return columns
+
+    def to_pandas(self, current_year=None):
+        return pd.DataFrame(self.column_arrays(current_year), copy=False)
+
+    # Needs the optional pyarrow package
+    def to_arrow(self, current_year=None):
+        import pyarrow
+        return pyarrow.table(self.column_arrays(current_year))
+
+# Round every money column to cents in one pass
+def round_cpf_balance(cpf_balance):
+    return CPFProjection({column: values if column in ('Year', 'Month', 'Age', 'Valid') else np.round(values, 2)
+                          for column, values in cpf_balance.items()})
+
+# Investment scenarios of one person from a single engine pass: the CPF accounts and cash savings are
+# projected once and every scenario (a dict that may set annual_investment_premium, annual_interest_rate
+# and investment_current_age) is evaluated as one row of a stacked investment overlay
+def calculate_cpf_balance_scenarios(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                                    milestones, scenarios, existing_oa=0.0, existing_sa=0.0, existing_ma=0.0,
+                                    existing_cash=0.0, rounded=True, rate_schedule=None):
+    ages = np.arange(current_age, projected_age + 1)
+    base = project_cpf_base(ages, build_milestone_vector(ages, milestones), salary, bonus, thirteenth_month,
+                            monthly_expenses, existing_oa=existing_oa, existing_sa=existing_sa,
+                            existing_ma=existing_ma, existing_cash=existing_cash, rate_schedule=rate_schedule)
+    settings = list(scenarios.values())
+    investment = project_investment(
+        ages,
+        np.array([float(scenario.get("annual_investment_premium", 0.0)) for scenario in settings])[:, None],
+        np.array([float(scenario.get("annual_interest_rate", 0.0)) for scenario in settings])[:, None],
+        np.array([scenario.get("investment_current_age", 0) for scenario in settings])[:, None])
+    results = {}
+    for index, name in enumerate(scenarios):
+        cpf_balance = {'Year': np.arange(1, len(ages) + 1), 'Age': ages}
+        cpf_balance.update(combine_cpf_projection(base, {column: values[index]
+                                                         for column, values in investment.items()}))
+        results[name] = round_cpf_balance(cpf_balance) if rounded else cpf_balance
+    return results
+
+# Person's projection with their investment plan and without it, sharing one CPF / cash pass
+def calculate_cpf_balance_with_and_without_investment(salary, bonus, thirteenth_month, monthly_expenses, current_age,
+                                                      projected_age, annual_investment_premium, annual_interest_rate,
+                                                      milestones, existing_oa=0.0, existing_sa=0.0, existing_ma=0.0,
+                                                      existing_cash=0.0, investment_current_age=0,
+                                                      rate_schedule=None):
+    results = calculate_cpf_balance_scenarios(
+        salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age, milestones,
+        {
+            "with_investment": {
+                "annual_investment_premium": annual_investment_premium,
+                "annual_interest_rate": annual_interest_rate,
+                "investment_current_age": investment_current_age
+            },
+            "without_investment": {}
+        },
+        existing_oa=existing_oa, existing_sa=existing_sa, existing_ma=existing_ma, existing_cash=existing_cash,
+        rate_schedule=rate_schedule)
+    without_investment = results["without_investment"].without('Cumulative Investment Premium', 'Investment Value')
+    return results["with_investment"], without_investment
+
+# Inputs that drive the scenario-independent CPF / cash part and the investment part of a projection
+BASE_FIELDS = ("salary", "bonus", "thirteenth_month", "monthly_expenses", "existing_oa", "existing_sa",
+               "existing_ma", "existing_cash")
+INVESTMENT_FIELDS = ("annual_investment_premium", "annual_interest_rate")
+
+# Index of the first year at which two constant-or-curve inputs differ over the years they both cover,
+# or None when they agree
+def first_changed_year(value, previous):
+    if np.ndim(value) == 0 and np.ndim(previous) == 0:
+        return None if value == previous else 0
+    years = min(np.size(item) for item in (value, previous) if np.ndim(item))
+    changed = np.flatnonzero(np.broadcast_to(yearly_values(value, years), years)
+                             != np.broadcast_to(yearly_values(previous, years), years))
+    return int(changed[0]) if len(changed) else None
+
+# Projection that keeps its unrounded per-year state (cash, OA, SA, MA and the investment) as checkpoints
+# between calls. update() compares the new profile with the previous one and only recomputes the years from
+# the earliest affected age, resuming from the checkpoint of the year before: a milestone edit at 45 only
+# reprojects the CPF / cash part from 45, and a premium or rate edit only the investment from its start age.
+class IncrementalProjection:
+    def __init__(self, rate_schedule=None):
+        self.rate_schedule = rate_schedule
+        self.inputs = None
+        self.base = None
+        self.investment = None
+        # Ages the last update resumed from, for the CPF / cash part and the investment (None: nothing rerun)
+        self.base_resumed_from = None
+        self.investment_resumed_from = None
+
+    # Earliest ages at which the CPF / cash part and the investment differ from the previous inputs
+    def first_changed_ages(self, inputs):
+        previous = self.inputs
+        if previous is None or inputs["current_age"] != previous["current_age"]:
+            return inputs["current_age"], inputs["current_age"]
+        extended = previous["projected_age"] + 1 if inputs["projected_age"] > previous["projected_age"] else None
+        investment_from = extended
+        # A changed constant reruns every year, a changed curve only from the first year it differs
+        changed_ages = [] if extended is None else [extended]
+        for field in BASE_FIELDS:
+            changed = first_changed_year(inputs[field], previous[field])
+            if changed is not None:
+                changed_ages.append(inputs["current_age"] + changed)
+        changed_ages += [age for age in set(inputs["milestones"]) | set(previous["milestones"])
+                         if inputs["milestones"].get(age) != previous["milestones"].get(age)]
+        base_from = min(changed_ages) if changed_ages else None
+        # Years before either investment start age are untouched by premium, rate or start age changes
+        if any(inputs[field] != previous[field] for field in INVESTMENT_FIELDS + ("investment_current_age",)):
+            investment_from = max(inputs["current_age"], min(inputs["investment_current_age"],
+                                                             previous["investment_current_age"]))
+        return base_from, investment_from
+
+    # Project a profile and return (with investment, without investment) like
+    # calculate_cpf_balance_with_and_without_investment
+    def update(self, profile):
+        inputs = {field: profile.get(field, default) for field, default in PROFILE_DEFAULTS.items()}
+        inputs["milestones"] = milestone_totals(inputs["milestones"], inputs["current_age"], inputs["projected_age"])
+        current_age, projected_age = inputs["current_age"], inputs["projected_age"]
+        years = max(projected_age - current_age + 1, 0)
+        for field in CURVE_FIELDS:
+            if np.ndim(inputs[field]):
+                inputs[field] = np.array(yearly_values(inputs[field], years), dtype=float)
+        base_from, investment_from = self.first_changed_ages(inputs)
+
+        # Rows before the resume age are kept from the checkpoints, the rest is reprojected from the row before
+        kept = min(years, max((projected_age + 1 if base_from is None else base_from) - current_age, 0))
+        self.base_resumed_from = current_age + kept if kept < years or self.base is None else None
+        if self.base_resumed_from is None:
+            self.base = {column: values[:years] for column, values in self.base.items()}
+        else:
+            ages = np.arange(current_age + kept, projected_age + 1)
+            opening = {column: self.base[column][kept - 1] for column in self.base} if kept else {
+                'Cumulative Cash Savings': inputs["existing_cash"], 'Cumulative OA': inputs["existing_oa"],
+                'Cumulative SA': inputs["existing_sa"], 'Cumulative MA': inputs["existing_ma"]}
+            salary, bonus, thirteenth_month, monthly_expenses = (
+                inputs[field][kept:] if np.ndim(inputs[field]) else inputs[field] for field in CURVE_FIELDS)
+            tail = project_cpf_base(
+                ages, build_milestone_vector(ages, inputs["milestones"]), salary, bonus, thirteenth_month,
+                monthly_expenses, existing_oa=opening['Cumulative OA'],
+                existing_sa=opening['Cumulative SA'], existing_ma=opening['Cumulative MA'],
+                existing_cash=opening['Cumulative Cash Savings'], rate_schedule=self.rate_schedule)
+            self.base = {column: np.concatenate([self.base[column][:kept], values]) if kept else values
+                         for column, values in tail.items()}
+
+        kept = min(years, max((projected_age + 1 if investment_from is None else investment_from) - current_age, 0))
+        self.investment_resumed_from = current_age + kept if kept < years or self.investment is None else None
+        if self.investment_resumed_from is None:
+            self.investment = {column: values[:years] for column, values in self.investment.items()}
+        else:
+            ages = np.arange(current_age + kept, projected_age + 1)
+            tail = project_investment(
+                ages, float(inputs["annual_investment_premium"]), inputs["annual_interest_rate"],
+                inputs["investment_current_age"],
+                existing_investment=self.investment['Investment Value'][kept - 1] if kept else 0.0)
+            if kept:
+                tail['Cumulative Investment Premium'] += self.investment['Cumulative Investment Premium'][kept - 1]
+            self.investment = {column: np.concatenate([self.investment[column][:kept], values]) if kept else values
+                               for column, values in tail.items()}
+        self.inputs = inputs
+
+        ages = np.arange(current_age, projected_age + 1)
+        with_investment = {'Year': np.arange(1, len(ages) + 1), 'Age': ages}
+        with_investment.update(combine_cpf_projection(self.base, self.investment))
+        without_investment = {'Year': np.arange(1, len(ages) + 1), 'Age': ages}
+        without_investment.update(self.base)
+        without_investment['Net Worth'] = self.base['Cumulative Cash Savings'] + self.base['Cumulative Total CPF']
+        return round_cpf_balance(with_investment), round_cpf_balance(without_investment)
+
+# Lazy version of calculate_cpf_balance: yields one rounded year record ({'Year', 'Age', <columns>}) at a time
+# from a plain running state, so callers can stop as soon as they have what they need (net worth turning
+# negative, a target being reached) or write rows out without building the whole table first.
+def iter_cpf_balance(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                     annual_investment_premium, annual_interest_rate, milestones,
+                     existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                     investment_current_age=0, rate_schedule=None):
+    rate_schedule = rate_schedule or get_cpf_rate_schedule()
+    milestone_amounts = milestone_totals(milestones, current_age, projected_age)
+    years = max(projected_age - current_age + 1, 0)
+    # Constants and per-year curves alike as one value per year
+    salaries, bonuses, thirteenth_months, expenses = (
+        np.broadcast_to(yearly_values(value, years), years).tolist()
+        for value in (salary, bonus, thirteenth_month, monthly_expenses))
+    growth = 1 + annual_interest_rate / 100
+    cash, oa, sa, ma = existing_cash, existing_oa, existing_sa, existing_ma
+    premiums, investment_value = 0.0, 0.0
+    for year, age in enumerate(range(current_age, projected_age + 1), start=1):
+        salary, bonus, thirteenth_month = salaries[year - 1], bonuses[year - 1], thirteenth_months[year - 1]
+        monthly_expenses = expenses[year - 1]
+        annual_income = salary * 12 + bonus + thirteenth_month
+        oa_rate, sa_rate, ma_rate = rate_schedule.allocation_rates(age)
+        _, employee_rate, total_rate = rate_schedule.contribution_rates(age)
+        cpf_contribution = annual_income * total_rate
+        cash += ((salary * (1 - employee_rate)) - monthly_expenses) * 12 + (bonus * (1 - employee_rate)) + (
+            thirteenth_month * (1 - employee_rate)) + milestone_amounts.get(age, 0.0)
+        oa += cpf_contribution * oa_rate
+        sa += cpf_contribution * sa_rate
+        ma += cpf_contribution * ma_rate
+        if age >= investment_current_age:
+            premiums += annual_investment_premium
+            investment_value = (investment_value + annual_investment_premium) * growth
+        total_cpf = oa + sa + ma
+        values = np.round([cash - premiums, oa, sa, ma, total_cpf, premiums, investment_value,
+                           cash - premiums + total_cpf + investment_value], 2).tolist()
+        record = {'Year': year, 'Age': age}
+        record.update(zip(COMBINED_COLUMNS, values))
+        yield record
+
+# Monthly projection, 12 rows per year of age ('Month' counts from 1, 'Age' is the age that month falls in).
+# Salary, expenses and CPF contributions flow every month; the bonus and the 13th month are paid in the given
+# month of each year (1-12, December by default) and milestones in their month (the first unless set). The annual
+# investment premium is paid in twelve monthly instalments, compounding monthly at annual_interest_rate / 12.
+# Cash and CPF balances at each year end equal the yearly projection; only the investment differs, from the
+# monthly premiums and compounding. Every column is a cumsum over the month grid, so 720 steps stay vectorized.
+def project_cpf_balance_monthly(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                                annual_investment_premium, annual_interest_rate, milestones,
+                                existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                                investment_current_age=0, bonus_month=12, thirteenth_month_month=12,
+                                rate_schedule=None):
+    if not (1 <= bonus_month <= 12 and 1 <= thirteenth_month_month <= 12):
+        raise ValueError("bonus_month and thirteenth_month_month must be between 1 and 12")
+    years = max(projected_age - current_age + 1, 0)
+    ages = np.repeat(np.arange(current_age, projected_age + 1), 12)
+    month_of_year = np.tile(np.arange(1, 13), years)
+    allocation, contribution = (rate_schedule or get_cpf_rate_schedule()).rates_for_ages(ages)
+    employee_rate, total_rate = contribution[:, 1], contribution[:, 2]
+    # Per-year curves hold for the 12 months of their year
+    salary, bonus, thirteenth_month, monthly_expenses = (
+        np.repeat(yearly_values(value, years), 12) if np.ndim(value) else value
+        for value in (salary, bonus, thirteenth_month, monthly_expenses))
+
+    monthly_income = (salary + np.where(month_of_year == bonus_month, bonus, 0.0)
+                      + np.where(month_of_year == thirteenth_month_month, thirteenth_month, 0.0))
+    cpf_contribution = monthly_income * total_rate
+    milestone_amounts = milestone_series(milestones, current_age, len(ages), periods_per_year=12)
+    base_cash = existing_cash + np.cumsum(monthly_income * (1 - employee_rate) - monthly_expenses
+                                          + milestone_amounts)
+    cumulative_oa, cumulative_sa, cumulative_ma = (
+        existing + np.cumsum(cpf_contribution * allocation[:, account])
+        for account, existing in enumerate((existing_oa, existing_sa, existing_ma)))
+
+    investment = project_investment(ages, annual_investment_premium / 12, annual_interest_rate / 12,
+                                    investment_current_age)
+    cpf_balance = {'Month': np.arange(1, len(ages) + 1), 'Age': ages}
+    cpf_balance.update(combine_cpf_projection({
+        'Cumulative Cash Savings': base_cash,
+        'Cumulative OA': cumulative_oa,
+        'Cumulative SA': cumulative_sa,
+        'Cumulative MA': cumulative_ma,
+        'Cumulative Total CPF': cumulative_oa + cumulative_sa + cumulative_ma
+    }, investment))
+    return cpf_balance
+
+# Year-end rows of a monthly projection, in the same layout as calculate_cpf_balance ('Year' from 1)
+def downsample_to_yearly(monthly_balance):
+    yearly = {'Year': np.arange(1, len(monthly_balance['Month']) // 12 + 1)}
+    yearly.update({column: values[11::12] for column, values in monthly_balance.items() if column != 'Month'})
+    return yearly
+
+# Rounded monthly projection, or its year-end rows when yearly is True
+def calculate_cpf_balance_monthly(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                                  annual_investment_premium, annual_interest_rate, milestones,
+                                  existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                                  investment_current_age=0, bonus_month=12, thirteenth_month_month=12,
+                                  yearly=False, rate_schedule=None):
+    cpf_balance = project_cpf_balance_monthly(
+        salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+        float(annual_investment_premium), annual_interest_rate, milestones,
+        existing_oa=existing_oa, existing_sa=existing_sa, existing_ma=existing_ma, existing_cash=existing_cash,
+        investment_current_age=investment_current_age, bonus_month=bonus_month,
+        thirteenth_month_month=thirteenth_month_month, rate_schedule=rate_schedule)
+    if yearly:
+        cpf_balance = downsample_to_yearly(cpf_balance)
+    return round_cpf_balance(cpf_balance)
+
+# Money amounts as int64 cents, rounding half to even
+def to_cents(amount):
+    return np.rint(np.asarray(amount, dtype=float) * 100).astype(np.int64)
+
+# Projection with every balance held as int64 cents, so results are exact and identical wherever they are run.
+# Values are rounded to whole cents at these points only, and everything else is integer arithmetic:
+#   1. inputs (salary, bonus, 13th month, expenses, premium, existing balances, each age's milestone total)
+#   2. each year's contribution to each CPF account, and the year's employee CPF deduction
+#   3. the investment value at each year end (compounded in floats from the cent premiums, then rounded)
+# Total CPF is the sum of the rounded accounts, and net worth is cash + total CPF + investment value.
+def project_cpf_balance_cents(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                              annual_investment_premium, annual_interest_rate, milestones,
+                              existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                              investment_current_age=0, rate_schedule=None):
+    ages = np.arange(current_age, projected_age + 1)
+    allocation, contribution = (rate_schedule or get_cpf_rate_schedule()).rates_for_ages(ages)
+    salary, bonus, thirteenth_month, monthly_expenses = (
+        yearly_values(value, len(ages)) for value in (salary, bonus, thirteenth_month, monthly_expenses))
+    annual_income = to_cents(salary) * 12 + to_cents(bonus) + to_cents(thirteenth_month)
+    account_contributions = np.rint((annual_income * contribution[:, 2])[:, None] * allocation).astype(np.int64)
+    employee_deduction = np.rint(annual_income * contribution[:, 1]).astype(np.int64)
+    net_annual_salary = annual_income - employee_deduction - to_cents(monthly_expenses) * 12
+    cumulative_oa, cumulative_sa, cumulative_ma = (
+        to_cents(existing) + np.cumsum(account_contributions[:, account])
+        for account, existing in enumerate((existing_oa, existing_sa, existing_ma)))
+
+    premium = to_cents(annual_investment_premium)
+    investment = project_investment(ages, premium / 100, annual_interest_rate, investment_current_age)
+    cumulative_premium = np.cumsum(np.where(ages >= investment_current_age, premium, 0))
+    investment_value = to_cents(investment['Investment Value'])
+    cumulative_cash_savings = (to_cents(existing_cash) + np.cumsum(
+        net_annual_salary + to_cents(build_milestone_vector(ages, milestones))) - cumulative_premium)
+    cumulative_total_cpf = cumulative_oa + cumulative_sa + cumulative_ma
+    return {
+        'Year': np.arange(1, len(ages) + 1),
+        'Age': ages,
+        'Cumulative Cash Savings': cumulative_cash_savings,
+        'Cumulative OA': cumulative_oa,
+        'Cumulative SA': cumulative_sa,
+        'Cumulative MA': cumulative_ma,
+        'Cumulative Total CPF': cumulative_total_cpf,
+        'Cumulative Investment Premium': cumulative_premium,
+        'Investment Value': investment_value,
+        'Net Worth': cumulative_cash_savings + cumulative_total_cpf + investment_value
+    }
+
+# Cent columns back to dollars for display; exact to the cent, so no further rounding is needed
+def cents_to_dollars(cpf_balance):
+    return {column: values if column in ('Year', 'Month', 'Age', 'Valid') else values / 100
+            for column, values in cpf_balance.items()}
+
+# Add a new function to calculate CPF balance without investment
+def calculate_cpf_balance_without_investment(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                                              milestones, existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                                              rate_schedule=None):
+    ages = np.arange(current_age, projected_age + 1)
+    cpf_balance = {'Year': np.arange(1, len(ages) + 1), 'Age': ages}
+    cpf_balance.update(project_cpf_base(ages, build_milestone_vector(ages, milestones), salary, bonus,
+                                        thirteenth_month, monthly_expenses, existing_oa=existing_oa,
+                                        existing_sa=existing_sa, existing_ma=existing_ma, existing_cash=existing_cash,
+                                        rate_schedule=rate_schedule))
+    cpf_balance['Net Worth'] = cpf_balance['Cumulative Cash Savings'] + cpf_balance['Cumulative Total CPF']
+    return round_cpf_balance(cpf_balance)
+
+# Calculate CPF balance and financial metrics
+def calculate_cpf_balance(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                          annual_investment_premium, annual_interest_rate, milestones,
+                          existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                          investment_current_age=0, rate_schedule=None):
+    return round_cpf_balance(project_cpf_balance(
+        salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+        annual_investment_premium, annual_interest_rate, milestones,
+        existing_oa=existing_oa, existing_sa=existing_sa, existing_ma=existing_ma, existing_cash=existing_cash,
+        investment_current_age=investment_current_age, rate_schedule=rate_schedule))
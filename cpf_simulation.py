@@ -0,0 +1,276 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cpf_engine import build_milestone_vector, project_cpf_base
+
+# Percentile bands reported by the Monte Carlo simulations
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Quantile levels (in percent) kept per year in a shard summary; merged summaries are re-sampled on them
+SUMMARY_QUANTILES = np.linspace(0, 100, 1001)
+
+# Paths simulated per shard of a parallel run. Shards, not workers, own the random streams, so the
+# result depends only on the seed, the path count and this size, never on the worker count.
+SHARD_PATHS = 100_000
+
+# Supported return distributions for the simulated investment
+RETURN_DISTRIBUTIONS = ("normal", "lognormal", "student_t", "bootstrap")
+
+# Random yearly growth factors (1 + return) of shape (years, paths). Rates are in percent like
+# annual_interest_rate: `annual_interest_rate` is the mean yearly return and `volatility` its standard
+# deviation. "bootstrap" resamples `historical_returns` instead. Returns below -100% are floored at -100%.
+def sample_growth_factors(rng, paths, years, annual_interest_rate, volatility=15.0, distribution="normal",
+                          degrees_of_freedom=5, historical_returns=None):
+    mean = annual_interest_rate / 100
+    spread = volatility / 100
+    if distribution == "normal":
+        growth = rng.standard_normal((years, paths))
+        growth *= spread
+        growth += 1 + mean
+    elif distribution == "lognormal":
+        # Log-normal gross return with the requested arithmetic mean and standard deviation
+        sigma = np.sqrt(np.log1p((spread / (1 + mean)) ** 2))
+        growth = rng.standard_normal((years, paths))
+        growth *= sigma
+        growth += np.log1p(mean) - sigma ** 2 / 2
+        np.exp(growth, out=growth)
+    elif distribution == "student_t":
+        if degrees_of_freedom <= 2:
+            raise ValueError("Student-t returns need more than 2 degrees of freedom.")
+        growth = rng.standard_t(degrees_of_freedom, (years, paths))
+        growth *= spread * np.sqrt((degrees_of_freedom - 2) / degrees_of_freedom)
+        growth += 1 + mean
+    elif distribution == "bootstrap":
+        if historical_returns is None or len(historical_returns) == 0:
+            raise ValueError("Bootstrap returns need a list of historical yearly returns.")
+        growth = 1 + rng.choice(np.asarray(historical_returns, dtype=float) / 100, (years, paths))
+    else:
+        raise ValueError(f"Unknown return distribution: {distribution}")
+    return np.maximum(growth, 0.0, out=growth)
+
+# Investment value paths (years x paths). Premiums and growth only apply in invested years; the
+# recurrence runs over years while every step is vectorized across all paths.
+def simulate_investment_paths(invested, annual_investment_premium, growth):
+    values = np.zeros((len(invested), growth.shape[1]))
+    value = np.zeros(growth.shape[1])
+    step = 0
+    for year, active in enumerate(invested):
+        if active:
+            value += annual_investment_premium
+            value *= growth[step]
+            step += 1
+        values[year] = value
+    return values
+
+# Percentiles of each year's paths (linear interpolation, as np.percentile). A full in-place sort of the
+# contiguous years x paths array is faster than np.percentile's partitioning for a handful of bands;
+# `values` is left sorted along the path axis.
+def path_percentiles(values, percentiles=DEFAULT_PERCENTILES):
+    values.sort(axis=1)
+    paths = values.shape[1]
+    bands = np.empty((len(percentiles), values.shape[0]))
+    for band, percentile in enumerate(percentiles):
+        position = percentile / 100 * (paths - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, paths - 1)
+        bands[band] = values[:, lower] + (values[:, upper] - values[:, lower]) * (position - lower)
+    return bands
+
+# Monte Carlo projection of one person: CPF and cash are projected once, the investment is simulated
+# over `paths` random return paths, and percentile bands of 'Investment Value' and 'Net Worth' are
+# returned per year as columns such as 'Net Worth P50'. Net worth is the deterministic cash and CPF
+# balance plus the investment value, so its percentiles are taken from the investment percentiles.
+def simulate_cpf_balance(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                         annual_investment_premium, annual_interest_rate, milestones,
+                         existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                         investment_current_age=0, paths=100_000, volatility=15.0, distribution="normal",
+                         degrees_of_freedom=5, historical_returns=None, percentiles=DEFAULT_PERCENTILES,
+                         seed=None, rate_schedule=None):
+    if paths < 1:
+        raise ValueError("A Monte Carlo simulation needs at least one path.")
+    ages = np.arange(current_age, projected_age + 1)
+    base = project_cpf_base(ages, build_milestone_vector(ages, milestones), salary, bonus, thirteenth_month,
+                            monthly_expenses, existing_oa=existing_oa, existing_sa=existing_sa,
+                            existing_ma=existing_ma, existing_cash=existing_cash, rate_schedule=rate_schedule)
+    invested = ages >= investment_current_age
+    cumulative_investment_premium = np.cumsum(np.where(invested, float(annual_investment_premium), 0.0))
+    deterministic_net_worth = (base['Cumulative Cash Savings'] - cumulative_investment_premium
+                               + base['Cumulative Total CPF'])
+
+    rng = np.random.default_rng(seed)
+    growth = sample_growth_factors(rng, paths, int(invested.sum()), annual_interest_rate, volatility=volatility,
+                                   distribution=distribution, degrees_of_freedom=degrees_of_freedom,
+                                   historical_returns=historical_returns)
+    investment_value = simulate_investment_paths(invested, float(annual_investment_premium), growth)
+    investment_mean = investment_value.mean(axis=1)
+    return summarize_simulation(ages, deterministic_net_worth, path_percentiles(investment_value, percentiles),
+                                investment_mean, percentiles)
+
+# Percentile band table of a simulation, in the same dict-of-columns shape as calculate_cpf_balance
+# Net worth is a deterministic shift of the investment value, so both share the same standard deviation.
+def summarize_simulation(ages, deterministic_net_worth, investment_percentiles, investment_mean,
+                         percentiles=DEFAULT_PERCENTILES, investment_std=None):
+    summary = {'Year': np.arange(1, len(ages) + 1), 'Age': ages}
+    for percentile, values in zip(percentiles, investment_percentiles):
+        summary[f'Investment Value P{percentile:g}'] = values
+    summary['Investment Value Mean'] = investment_mean
+    if investment_std is not None:
+        summary['Investment Value Std'] = investment_std
+    for percentile, values in zip(percentiles, investment_percentiles):
+        summary[f'Net Worth P{percentile:g}'] = deterministic_net_worth + values
+    summary['Net Worth Mean'] = deterministic_net_worth + investment_mean
+    if investment_std is not None:
+        summary['Net Worth Std'] = investment_std
+    return summary
+
+# Mergeable per-year summary of simulated paths (years x paths): path count, per-year mean and sum of
+# squared deviations (for the variance), and the per-year quantiles at SUMMARY_QUANTILES.
+# `values` is left sorted along the path axis.
+def summarize_paths(values):
+    mean = values.mean(axis=1)
+    m2 = ((values - mean[:, None]) ** 2).sum(axis=1)
+    return {'count': values.shape[1], 'mean': mean, 'm2': m2,
+            'quantiles': path_percentiles(values, SUMMARY_QUANTILES)}
+
+# Merge shard summaries into one. Each shard's quantiles define a piecewise-linear CDF per year; the
+# count-weighted mixture of those CDFs is inverted back onto SUMMARY_QUANTILES, and means and variances
+# are combined pairwise (Chan et al.). Shards are merged in the order given, which keeps parallel runs
+# bit-reproducible.
+def merge_path_summaries(summaries):
+    if len(summaries) == 1:
+        return summaries[0]
+    count, mean, m2 = summaries[0]['count'], summaries[0]['mean'], summaries[0]['m2']
+    for summary in summaries[1:]:
+        delta = summary['mean'] - mean
+        merged_count = count + summary['count']
+        mean = mean + delta * summary['count'] / merged_count
+        m2 = m2 + summary['m2'] + delta ** 2 * count * summary['count'] / merged_count
+        count = merged_count
+
+    counts = [summary['count'] for summary in summaries]
+    levels = SUMMARY_QUANTILES / 100
+    years = summaries[0]['quantiles'].shape[1]
+    quantiles = np.empty((len(SUMMARY_QUANTILES), years))
+    for year in range(years):
+        knots = [summary['quantiles'][:, year] for summary in summaries]
+        points = np.sort(np.concatenate(knots))
+        cdf = sum(count * np.interp(points, shard_knots, levels) for count, shard_knots in zip(counts, knots))
+        quantiles[:, year] = np.interp(levels, cdf / sum(counts), points)
+    return {'count': count, 'mean': mean, 'm2': m2, 'quantiles': quantiles}
+
+# Requested percentile bands (percentiles x years) read off a summary's quantile grid
+def summary_percentiles(summary, percentiles=DEFAULT_PERCENTILES):
+    return path_percentiles(np.ascontiguousarray(summary['quantiles'].T), percentiles)
+
+# One shard of a parallel simulation; a module-level function so worker processes can unpickle it
+def simulate_investment_shard(seed_sequence, paths, invested, annual_investment_premium, annual_interest_rate,
+                              volatility, distribution, degrees_of_freedom, historical_returns):
+    rng = np.random.default_rng(seed_sequence)
+    growth = sample_growth_factors(rng, paths, int(invested.sum()), annual_interest_rate, volatility=volatility,
+                                   distribution=distribution, degrees_of_freedom=degrees_of_freedom,
+                                   historical_returns=historical_returns)
+    return summarize_paths(simulate_investment_paths(invested, annual_investment_premium, growth))
+
+# Parallel Monte Carlo projection over millions of paths. Paths are split into SHARD_PATHS-sized shards,
+# each seeded from SeedSequence(seed).spawn, and run on a ProcessPoolExecutor; the per-shard quantile
+# summaries are merged in shard order. Results are identical for any `workers` (1 runs in-process).
+# Returns the same percentile band table as simulate_cpf_balance.
+def simulate_cpf_balance_parallel(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                                  annual_investment_premium, annual_interest_rate, milestones,
+                                  existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                                  investment_current_age=0, paths=1_000_000, volatility=15.0, distribution="normal",
+                                  degrees_of_freedom=5, historical_returns=None, percentiles=DEFAULT_PERCENTILES,
+                                  seed=None, workers=None, shard_paths=SHARD_PATHS, rate_schedule=None):
+    if paths < 1:
+        raise ValueError("A Monte Carlo simulation needs at least one path.")
+    ages = np.arange(current_age, projected_age + 1)
+    base = project_cpf_base(ages, build_milestone_vector(ages, milestones), salary, bonus, thirteenth_month,
+                            monthly_expenses, existing_oa=existing_oa, existing_sa=existing_sa,
+                            existing_ma=existing_ma, existing_cash=existing_cash, rate_schedule=rate_schedule)
+    invested = ages >= investment_current_age
+    cumulative_investment_premium = np.cumsum(np.where(invested, float(annual_investment_premium), 0.0))
+    deterministic_net_worth = (base['Cumulative Cash Savings'] - cumulative_investment_premium
+                               + base['Cumulative Total CPF'])
+
+    shard_sizes = [shard_paths] * (paths // shard_paths) + ([paths % shard_paths] if paths % shard_paths else [])
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(shard_sizes))
+    shard_arguments = [(seed_sequence, size, invested, float(annual_investment_premium), annual_interest_rate,
+                        volatility, distribution, degrees_of_freedom, historical_returns)
+                       for seed_sequence, size in zip(seed_sequences, shard_sizes)]
+    workers = min(workers or os.cpu_count() or 1, len(shard_sizes))
+    if workers == 1:
+        summaries = [simulate_investment_shard(*arguments) for arguments in shard_arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            summaries = list(executor.map(simulate_investment_shard, *zip(*shard_arguments)))
+
+    summary = merge_path_summaries(summaries)
+    return summarize_simulation(ages, deterministic_net_worth, summary_percentiles(summary, percentiles),
+                                summary['mean'], percentiles, investment_std=np.sqrt(summary['m2'] / summary['count']))
+
+# Streaming aggregation of simulated path chunks (years x paths each). Only a fixed-size per-year
+# quantile sketch and running mean / variance are kept, so memory is bounded by the chunk size rather
+# than the number of paths. Aggregators from separate streams can be merged.
+class StreamingPathAggregator:
+    def __init__(self):
+        self.summary = None
+
+    # Fold one chunk of paths into the running summary; the chunk is sorted in place
+    def update(self, values):
+        chunk = summarize_paths(values)
+        self.summary = chunk if self.summary is None else merge_path_summaries([self.summary, chunk])
+
+    # Fold in another aggregator's paths
+    def merge(self, other):
+        if other.summary is not None:
+            self.summary = other.summary if self.summary is None else merge_path_summaries([self.summary,
+                                                                                            other.summary])
+
+    @property
+    def count(self):
+        return 0 if self.summary is None else self.summary['count']
+
+    @property
+    def mean(self):
+        return self.summary['mean']
+
+    @property
+    def variance(self):
+        return self.summary['m2'] / self.summary['count']
+
+    # Percentile bands (percentiles x years) of all paths seen so far
+    def percentiles(self, percentiles=DEFAULT_PERCENTILES):
+        return summary_percentiles(self.summary, percentiles)
+
+# Monte Carlo projection that streams `paths` through the aggregator `chunk_paths` at a time, so memory
+# stays bounded however many paths are simulated. Returns the same band table as simulate_cpf_balance,
+# plus 'Investment Value Std' and 'Net Worth Std'.
+def simulate_cpf_balance_streaming(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                                   annual_investment_premium, annual_interest_rate, milestones,
+                                   existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                                   investment_current_age=0, paths=1_000_000, volatility=15.0,
+                                   distribution="normal", degrees_of_freedom=5, historical_returns=None,
+                                   percentiles=DEFAULT_PERCENTILES, seed=None, chunk_paths=50_000,
+                                   rate_schedule=None):
+    if paths < 1:
+        raise ValueError("A Monte Carlo simulation needs at least one path.")
+    ages = np.arange(current_age, projected_age + 1)
+    base = project_cpf_base(ages, build_milestone_vector(ages, milestones), salary, bonus, thirteenth_month,
+                            monthly_expenses, existing_oa=existing_oa, existing_sa=existing_sa,
+                            existing_ma=existing_ma, existing_cash=existing_cash, rate_schedule=rate_schedule)
+    invested = ages >= investment_current_age
+    cumulative_investment_premium = np.cumsum(np.where(invested, float(annual_investment_premium), 0.0))
+    deterministic_net_worth = (base['Cumulative Cash Savings'] - cumulative_investment_premium
+                               + base['Cumulative Total CPF'])
+
+    rng = np.random.default_rng(seed)
+    aggregator = StreamingPathAggregator()
+    for start in range(0, paths, chunk_paths):
+        growth = sample_growth_factors(rng, min(chunk_paths, paths - start), int(invested.sum()),
+                                       annual_interest_rate, volatility=volatility, distribution=distribution,
+                                       degrees_of_freedom=degrees_of_freedom, historical_returns=historical_returns)
+        aggregator.update(simulate_investment_paths(invested, float(annual_investment_premium), growth))
+    return summarize_simulation(ages, deterministic_net_worth, aggregator.percentiles(percentiles),
+                                aggregator.mean, percentiles, investment_std=np.sqrt(aggregator.variance))
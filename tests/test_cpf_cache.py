@@ -0,0 +1,139 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import cpf_cache
+from cpf_cache import DiskProjectionCache, ProjectionCache, dump_result, load_result, projection_key
+from cpf_engine import calculate_cpf_balance_with_and_without_investment
+
+PROFILE = {"salary": 6000, "bonus": 10000, "thirteenth_month": 6000, "monthly_expenses": 2500,
+           "current_age": 30, "projected_age": 65, "annual_investment_premium": 12000,
+           "annual_interest_rate": 5, "milestones": {40: -50000}}
+
+
+def project(profile):
+    return calculate_cpf_balance_with_and_without_investment(**profile)
+
+
+def test_projection_cache_counts_hits_and_misses():
+    cache = ProjectionCache(maxsize=4)
+    calls = []
+    key = projection_key(PROFILE)
+    first = cache.get_or_compute(key, lambda: calls.append(1) or project(PROFILE))
+    second = cache.get_or_compute(key, lambda: calls.append(1) or project(PROFILE))
+    assert len(calls) == 1
+    assert second is first
+    assert cache.info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 4}
+    cache.clear()
+    assert cache.info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 4}
+
+
+def test_projection_cache_evicts_least_recently_used():
+    cache = ProjectionCache(maxsize=2)
+    for key in ("a", "b"):
+        cache.put(key, project(PROFILE))
+    assert cache.get("a") is not None
+    cache.put("c", project(PROFILE))
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_projection_cache_results_are_read_only():
+    cache = ProjectionCache()
+    with_investment, _ = cache.put("key", project(PROFILE))
+    with pytest.raises(ValueError):
+        with_investment['Net Worth'][0] = 0.0
+
+
+def test_projection_key_depends_only_on_projection_inputs():
+    assert projection_key(PROFILE) == projection_key(dict(PROFILE, name="Alex", milestones=[(40, -50000)]))
+    assert projection_key(PROFILE) == projection_key(dict(PROFILE, salary=[6000.0]))
+    assert projection_key(PROFILE) != projection_key(dict(PROFILE, salary=np.r_[6000.0, 6500.0]))
+    assert projection_key(PROFILE) != projection_key(dict(PROFILE, milestones={41: -50000}))
+
+
+def assert_same_result(result, expected):
+    assert isinstance(result, tuple) == isinstance(expected, tuple)
+    for part, expected_part in zip(result, expected) if isinstance(result, tuple) else [(result, expected)]:
+        assert list(part) == list(expected_part)
+        for column, values in expected_part.items():
+            assert part[column].dtype == np.asarray(values).dtype
+            np.testing.assert_array_equal(part[column], values)
+
+
+def test_dump_and_load_result_round_trip():
+    result = project(PROFILE)
+    assert_same_result(load_result(*dump_result(result)), result)
+    assert_same_result(load_result(*dump_result(result[0])), result[0])
+
+
+def test_disk_cache_round_trips_across_reopens(tmp_path):
+    path = str(tmp_path / "projections.sqlite3")
+    key, result = projection_key(PROFILE), project(PROFILE)
+    disk_cache = DiskProjectionCache(path)
+    assert disk_cache.get(key) is None
+    disk_cache.put(key, result)
+    disk_cache.close()
+
+    disk_cache = DiskProjectionCache(path)
+    assert_same_result(disk_cache.get(key), result)
+    assert (disk_cache.hits, disk_cache.misses) == (1, 0)
+    disk_cache.close()
+
+
+def test_disk_cache_drops_rows_from_another_engine_version(tmp_path, monkeypatch):
+    path = str(tmp_path / "projections.sqlite3")
+    monkeypatch.setattr(cpf_cache, "ENGINE_VERSION", "old")
+    disk_cache = DiskProjectionCache(path)
+    disk_cache.put("key", project(PROFILE))
+    disk_cache.close()
+    monkeypatch.undo()
+
+    disk_cache = DiskProjectionCache(path)
+    assert disk_cache.get("key") is None
+    disk_cache.close()
+
+
+def test_disk_cache_drops_rows_from_retired_rate_schedules(tmp_path):
+    path = str(tmp_path / "projections.sqlite3")
+    disk_cache = DiskProjectionCache(path)
+    disk_cache.put("retired", project(PROFILE))
+    disk_cache.put("current", project(PROFILE))
+    disk_cache.close()
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE projections SET rate_schedule = 'retired' WHERE key = 'retired'")
+
+    disk_cache = DiskProjectionCache(path)
+    assert disk_cache.get("retired") is None
+    assert disk_cache.get("current") is not None
+    disk_cache.close()
+
+
+def test_disk_cache_keeps_the_newest_max_entries_rows(tmp_path):
+    path = str(tmp_path / "projections.sqlite3")
+    disk_cache = DiskProjectionCache(path)
+    for key in ("a", "b", "c"):
+        disk_cache.put(key, project(PROFILE))
+    disk_cache.close()
+    # Distinct write times, oldest first, whatever the clock resolution
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE projections SET created = CASE key WHEN 'a' THEN 1 WHEN 'b' THEN 2 ELSE 3 END")
+
+    disk_cache = DiskProjectionCache(path, max_entries=2)
+    assert disk_cache.get("a") is None
+    assert disk_cache.get("b") is not None
+    assert disk_cache.get("c") is not None
+    disk_cache.close()
+
+
+def test_projection_cache_falls_back_to_disk(tmp_path):
+    disk_cache = DiskProjectionCache(str(tmp_path / "projections.sqlite3"))
+    key, calls = projection_key(PROFILE), []
+    ProjectionCache(disk_cache=disk_cache).get_or_compute(key, lambda: calls.append(1) or project(PROFILE))
+    result = ProjectionCache(disk_cache=disk_cache).get_or_compute(key, lambda: calls.append(1) or project(PROFILE))
+    assert len(calls) == 1
+    assert_same_result(result, project(PROFILE))
+    disk_cache.close()
@@ -0,0 +1,255 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cpf_engine import (PROFILE_DEFAULTS, IncrementalProjection, calculate_cpf_balance, calculate_cpf_balance_batch,
+                        calculate_cpf_balance_without_investment, fixed_growth_curve, get_cpf_allocation_rates,
+                        get_cpf_rates, goal_seek, milestone_events, solve_cpf_state_at_age, state_at)
+
+
+# The original per-year loop the vectorized engine replaced, unrounded
+def reference_cpf_balance(salary, bonus, thirteenth_month, monthly_expenses, current_age, projected_age,
+                          milestones, annual_investment_premium=0.0, annual_interest_rate=0.0,
+                          existing_oa=0.0, existing_sa=0.0, existing_ma=0.0, existing_cash=0.0,
+                          investment_current_age=0, with_investment=True):
+    columns = ['Year', 'Age', 'Cumulative Cash Savings', 'Cumulative OA', 'Cumulative SA', 'Cumulative MA',
+               'Cumulative Total CPF', 'Cumulative Investment Premium', 'Investment Value', 'Net Worth']
+    if not with_investment:
+        columns.remove('Cumulative Investment Premium')
+        columns.remove('Investment Value')
+    cpf_balance = {column: [] for column in columns}
+    cumulative_cash_savings = existing_cash
+    cumulative_oa = existing_oa
+    cumulative_sa = existing_sa
+    cumulative_ma = existing_ma
+    cumulative_investment_premium = 0.0
+    investment_value = 0.0
+    for year in range(projected_age - current_age + 1):
+        age = current_age + year
+        oa_rate, sa_rate, ma_rate = get_cpf_allocation_rates(age)
+        employer_rate, employee_rate, total_rate = get_cpf_rates(age)
+        cpf_contribution = (salary * 12 + bonus + thirteenth_month) * total_rate
+        cumulative_cash_savings += ((salary * (1 - employee_rate)) - monthly_expenses) * 12 + (
+            bonus * (1 - employee_rate)) + (thirteenth_month * (1 - employee_rate))
+        if with_investment and age >= investment_current_age:
+            cumulative_cash_savings -= annual_investment_premium
+            cumulative_investment_premium += annual_investment_premium
+            investment_value = (investment_value + annual_investment_premium) * (1 + annual_interest_rate / 100)
+        cumulative_oa += cpf_contribution * oa_rate
+        cumulative_sa += cpf_contribution * sa_rate
+        cumulative_ma += cpf_contribution * ma_rate
+        cumulative_cash_savings += milestones.get(age, 0.0)
+        row = {
+            'Year': year + 1,
+            'Age': age,
+            'Cumulative Cash Savings': cumulative_cash_savings,
+            'Cumulative OA': cumulative_oa,
+            'Cumulative SA': cumulative_sa,
+            'Cumulative MA': cumulative_ma,
+            'Cumulative Total CPF': cumulative_oa + cumulative_sa + cumulative_ma,
+            'Cumulative Investment Premium': cumulative_investment_premium,
+            'Investment Value': investment_value,
+            'Net Worth': cumulative_cash_savings + cumulative_oa + cumulative_sa + cumulative_ma + investment_value
+        }
+        for column in columns:
+            cpf_balance[column].append(row[column])
+    return cpf_balance
+
+
+def random_profile(rng, horizon=None):
+    current_age = rng.randint(16, 70)
+    return {
+        "salary": rng.uniform(0, 20000),
+        "bonus": rng.uniform(0, 50000),
+        "thirteenth_month": rng.uniform(0, 20000),
+        "monthly_expenses": rng.uniform(0, 8000),
+        "current_age": current_age,
+        "projected_age": current_age + (rng.randint(0, 60) if horizon is None else horizon - 1),
+        "milestones": {rng.randint(current_age - 5, current_age + 65): rng.uniform(-1e5, 1e5)
+                       for _ in range(rng.randint(0, 5))},
+        "existing_oa": rng.uniform(0, 1e5),
+        "existing_sa": rng.uniform(0, 1e5),
+        "existing_ma": rng.uniform(0, 1e5),
+        "existing_cash": rng.uniform(0, 1e5),
+    }
+
+
+def assert_matches_reference(result, reference):
+    assert list(result) == list(reference)
+    for column, values in reference.items():
+        assert len(result[column]) == len(values), column
+        # Rounded to the cent; summation order may move a half-cent boundary by one cent
+        np.testing.assert_allclose(result[column], values, rtol=1e-12, atol=0.01, err_msg=column)
+
+
+@pytest.mark.parametrize("horizon", [None, 0, 1])
+def test_calculate_cpf_balance_matches_reference_loop(horizon):
+    rng = random.Random(horizon)
+    for _ in range(200):
+        profile = random_profile(rng, horizon)
+        premium, rate = rng.uniform(0, 30000), rng.uniform(0, 15)
+        investment_current_age = rng.randint(0, 100)
+        result = calculate_cpf_balance(**profile, annual_investment_premium=premium, annual_interest_rate=rate,
+                                       investment_current_age=investment_current_age)
+        assert_matches_reference(result, reference_cpf_balance(
+            **profile, annual_investment_premium=premium, annual_interest_rate=rate,
+            investment_current_age=investment_current_age))
+
+
+@pytest.mark.parametrize("horizon", [None, 0, 1])
+def test_calculate_cpf_balance_without_investment_matches_reference_loop(horizon):
+    rng = random.Random(100 + (horizon or 0))
+    for _ in range(200):
+        profile = random_profile(rng, horizon)
+        assert_matches_reference(calculate_cpf_balance_without_investment(**profile),
+                                 reference_cpf_balance(**profile, with_investment=False))
+
+
+def test_investment_starts_at_investment_current_age():
+    result = calculate_cpf_balance(5000, 0, 0, 2000, 30, 40, 10000, 5, {}, investment_current_age=35)
+    premiums = dict(zip(result['Age'], result['Cumulative Investment Premium']))
+    assert premiums[34] == 0
+    assert premiums[35] == 10000
+    assert premiums[40] == 60000
+
+
+@pytest.mark.parametrize("solve_for", ["annual_investment_premium", "monthly_expenses", "salary"])
+@pytest.mark.parametrize("target_age", [None, 55])
+def test_goal_seek_reaches_target(solve_for, target_age):
+    profile = {"salary": 6000, "bonus": 10000, "thirteenth_month": 6000, "monthly_expenses": 2500,
+               "current_age": 30, "projected_age": 60, "annual_investment_premium": 12000,
+               "annual_interest_rate": 5, "milestones": {40: -50000}}
+    value = goal_seek(profile, 2.5e6, solve_for, target_age=target_age)
+    assert value is not None
+    age = profile["projected_age"] if target_age is None else target_age
+    solved = dict(profile, **{solve_for: value}, projected_age=age)
+    assert state_at(solved, columns='Net Worth') == pytest.approx(2.5e6, abs=0.01)
+
+
+def test_batch_matches_single_profiles_with_mixed_milestones():
+    rng = random.Random(7)
+    milestone_forms = [
+        {},
+        {"45": -20000.0, 50: 10000.0},
+        [(40, -5000.0), (40, 2500.0)],
+        [{"start_age": 35, "end_age": 55, "every": 2, "amount": -3000.0, "escalation": 4}],
+        milestone_events([{"age": 20, "amount": -1000.0, "every": 3, "escalation": -10}, {"age": 60, "amount": 5e4}])
+    ]
+    profiles = []
+    for index in range(50):
+        profile = random_profile(rng)
+        profile.update(milestones=milestone_forms[index % len(milestone_forms)], annual_investment_premium=6000.0,
+                       annual_interest_rate=4.0, investment_current_age=rng.randint(20, 60))
+        profiles.append(profile)
+    batch = calculate_cpf_balance_batch(profiles)
+    for row, profile in enumerate(profiles):
+        single = calculate_cpf_balance(**profile)
+        years = len(single['Age'])
+        assert batch['Valid'][row].sum() == years
+        for column in ('Cumulative Cash Savings', 'Cumulative Total CPF', 'Investment Value', 'Net Worth'):
+            np.testing.assert_allclose(batch[column][row, :years], single[column], atol=0.01, err_msg=column)
+
+
+@pytest.mark.parametrize("solve_for", ["monthly_expenses", "salary"])
+def test_goal_seek_shifts_per_year_curves(solve_for):
+    profile = {"salary": fixed_growth_curve(6000, 31, 3), "bonus": 10000, "thirteenth_month": 6000,
+               "monthly_expenses": [2500, 2600], "current_age": 30, "projected_age": 60,
+               "annual_investment_premium": 12000, "annual_interest_rate": 5, "milestones": {}}
+    value = goal_seek(profile, 3e6, solve_for, target_age=55)
+    shift = np.asarray(value) - np.asarray(profile[solve_for])
+    np.testing.assert_allclose(shift, shift[0])
+    solved = dict(profile, **{solve_for: value}, projected_age=55)
+    assert state_at(solved, columns='Net Worth') == pytest.approx(3e6, abs=0.01)
+
+
+def test_solve_cpf_state_at_age_broadcasts_arrays_unless_curves():
+    salaries = np.array([5000.0, 6000.0])
+    broadcast = solve_cpf_state_at_age(60, salaries, 0, 0, 0, 30, 0, 0, {})['Net Worth']
+    assert broadcast == pytest.approx([solve_cpf_state_at_age(60, salary, 0, 0, 0, 30, 0, 0, {})['Net Worth']
+                                       for salary in salaries])
+    curve = solve_cpf_state_at_age(60, salaries, 0, 0, 0, 30, 0, 0, {}, curves=True)['Net Worth']
+    reference = reference_cpf_balance(5000.0, 0, 0, 0, 30, 30, {})['Net Worth'][-1] + (
+        reference_cpf_balance(6000.0, 0, 0, 0, 30, 60, {})['Net Worth'][-1]
+        - reference_cpf_balance(6000.0, 0, 0, 0, 30, 30, {})['Net Worth'][-1])
+    assert curve == pytest.approx(reference)
+    assert state_at({"salary": np.int64(5000), "current_age": 30, "projected_age": 60}, columns='Net Worth') == (
+        pytest.approx(broadcast[0]))
+
+
+def test_batch_from_dataframe_fills_missing_fields_with_defaults():
+    profiles = [
+        {"salary": 5000, "bonus": 10000, "current_age": 30, "projected_age": 60, "milestones": {40: -10000.0}},
+        {"salary": 6000, "current_age": 35, "projected_age": 50},
+        {"current_age": 35, "projected_age": 50, "milestones": [(40, 5000.0)]}
+    ]
+    from_frame = calculate_cpf_balance_batch(pd.DataFrame(profiles))
+    from_dicts = calculate_cpf_balance_batch(profiles)
+    for column in ('Cumulative Cash Savings', 'Cumulative Total CPF', 'Net Worth'):
+        np.testing.assert_array_equal(from_frame[column], from_dicts[column])
+
+
+def assert_matches_full_projection(projection, profile):
+    with_investment, without_investment = projection.update(profile)
+    inputs = dict(PROFILE_DEFAULTS, **profile)
+    expected = calculate_cpf_balance(**inputs)
+    expected_without = calculate_cpf_balance_without_investment(
+        **{field: value for field, value in inputs.items()
+           if field not in ("annual_investment_premium", "annual_interest_rate", "investment_current_age")})
+    for result, reference in ((with_investment, expected), (without_investment, expected_without)):
+        assert list(result) == list(reference)
+        for column in reference:
+            np.testing.assert_allclose(result[column], reference[column], atol=0.01, err_msg=column)
+
+
+def test_incremental_projection_matches_full_recompute_after_each_edit():
+    profile = {"salary": 6000, "bonus": 10000, "thirteenth_month": 6000, "monthly_expenses": 2500,
+               "current_age": 30, "projected_age": 65, "annual_investment_premium": 12000,
+               "annual_interest_rate": 5, "investment_current_age": 35, "milestones": {40: -50000},
+               "existing_oa": 20000, "existing_cash": 10000}
+    edits = [
+        ({"milestones": {40: -50000, 45: 20000}}, 45, None),
+        ({"milestones": [{"start_age": 50, "end_age": 60, "every": 2, "amount": -3000, "escalation": 3}]}, 40, None),
+        ({"annual_investment_premium": 15000}, None, 35),
+        ({"annual_interest_rate": 6}, None, 35),
+        ({"investment_current_age": 40}, None, 35),
+        ({"projected_age": 70}, 66, 66),
+        ({"projected_age": 55}, None, None),
+        ({"salary": fixed_growth_curve(6000, 26, 3)}, 31, None),
+        ({"salary": np.r_[fixed_growth_curve(6000, 20, 3), np.full(6, 9000.0)]}, 50, None),
+        ({"monthly_expenses": [2500] * 10 + [3000]}, 40, None),
+        ({"existing_sa": 5000}, 30, None),
+        ({"current_age": 32}, 32, 32),
+        ({}, None, None)
+    ]
+    projection = IncrementalProjection()
+    assert_matches_full_projection(projection, profile)
+    for edit, base_resumed_from, investment_resumed_from in edits:
+        profile = dict(profile, **edit)
+        assert_matches_full_projection(projection, profile)
+        assert projection.base_resumed_from == base_resumed_from, edit
+        assert projection.investment_resumed_from == investment_resumed_from, edit
+
+
+def test_incremental_projection_matches_full_recompute_on_random_edits():
+    rng = random.Random(16)
+    profile = dict(random_profile(rng), annual_investment_premium=6000.0, annual_interest_rate=4.0,
+                   investment_current_age=40)
+    projection = IncrementalProjection()
+    for _ in range(100):
+        field = rng.choice(["salary", "monthly_expenses", "milestones", "annual_investment_premium",
+                            "annual_interest_rate", "investment_current_age", "projected_age", "current_age"])
+        current_age = profile["current_age"]
+        if field == "milestones":
+            value = {rng.randint(current_age, current_age + 40): rng.uniform(-5e4, 5e4) for _ in range(3)}
+        elif field in ("projected_age", "investment_current_age"):
+            value = current_age + rng.randint(-1, 50)
+        elif field == "current_age":
+            value = rng.randint(20, 40)
+        elif field in ("salary", "monthly_expenses") and rng.random() < 0.5:
+            value = fixed_growth_curve(rng.uniform(1000, 10000), rng.randint(1, 40), rng.uniform(0, 4))
+        else:
+            value = rng.uniform(0, 10000)
+        profile = dict(profile, **{field: value})
+        assert_matches_full_projection(projection, profile)